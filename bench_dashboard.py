@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""Benchmarks dashboard.py at cluster scale without a cluster.
+
+Generates a synthetic .schedule-log and matching accounting and queue data
+for a number of jobs, and puts `sacct`, `squeue` and `scontrol` stand-ins
+that serve that data on PATH. Each scale is then run in a fresh process that
+imports dashboard.py from a fake cirrus-scripts directory, and drives the
+real code paths: the Slurm queries, State.update, JobList and the /jobs/
+endpoints. For each stage it reports wall time, peak RSS and, for the
+endpoints, the size of the response.
+
+	python3 bench_dashboard.py --scales 10000,100000 --output bench.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import resource
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+# Environment variable that tells the fake Slurm binaries where their data is
+DATA_VAR = 'FAKE_SLURM_DATA'
+
+STEPS = ['shard', 'merge-shard', 'clean-shard', 'split', 'translate', 'tokenise', 'align', 'fix', 'score', 'clean']
+
+LANGUAGES = ['bg', 'cs', 'da', 'de', 'el', 'es', 'et', 'fi', 'fr', 'ga', 'hr', 'hu', 'is', 'it', 'lt', 'lv', 'mt', 'nl', 'no', 'pl', 'pt', 'ro', 'sk', 'sl', 'sv']
+
+COLLECTIONS = ['wide00006', 'wide00015', 'hieu', 'philipp', 'marta']
+
+ACCOUNT = 'project_462000000'
+
+# Columns of our fake `sacct --format ALL`, a realistic subset of the real one.
+SACCT_COLUMNS = [
+	'Account', 'AdminComment', 'AllocCPUS', 'AllocNodes', 'AllocTRES', 'AssocID',
+	'AveCPU', 'AveDiskRead', 'AveDiskWrite', 'AveRSS', 'AveVMSize', 'Cluster',
+	'Comment', 'Constraints', 'CPUTime', 'CPUTimeRAW', 'DerivedExitCode',
+	'Elapsed', 'ElapsedRaw', 'Eligible', 'End', 'ExitCode', 'Flags', 'GID',
+	'Group', 'JobID', 'JobIDRaw', 'JobName', 'MaxRSS', 'NCPUS', 'NNodes',
+	'NodeList', 'NTasks', 'Partition', 'QOS', 'ReqCPUS', 'ReqMem', 'ReqNodes',
+	'ReqTRES', 'Start', 'State', 'Submit', 'Timelimit', 'TotalCPU', 'UID',
+	'User', 'WorkDir',
+]
+
+# squeue --format codes we know, and the header squeue prints for them.
+SQUEUE_COLUMNS = {
+	'i': 'JOBID',
+	'K': 'ARRAY_TASK_ID',
+	'F': 'ARRAY_JOB_ID',
+	'C': 'CPUS',
+	'b': 'TRES_PER_NODE',
+	'j': 'NAME',
+	'P': 'PARTITION',
+	'r': 'REASON',
+	'u': 'USER',
+	'y': 'NICE',
+	'T': 'STATE',
+	'M': 'TIME',
+	'N': 'NODELIST',
+}
+
+JOB_ID_PATTERN = re.compile(r'^(?P<array_job_id>\d+)(?:_(?P<array_task_id>\d+)|_\[(?P<array_task_start>\d+)-(?P<array_task_end>\d+)\])?(?:\.\w+)?$')
+
+
+def slurm_time(dt:datetime) -> str:
+	return dt.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def sacct_row(**values:Any) -> str:
+	return '|'.join(str(values.get(column, '')) for column in SACCT_COLUMNS)
+
+
+def generate(path:str, jobs:int, active:float = 0.05, seed:int = 1) -> Dict[str,int]:
+	"""Writes a fake cirrus-scripts directory to `path` with a .schedule-log
+	of about `jobs` jobs, mostly job arrays, and the sacct and squeue output
+	that goes with them. About `active` of the job arrays are still pending
+	or running."""
+	rng = random.Random(seed)
+
+	os.makedirs(os.path.join(path, 'env'), exist_ok=True)
+	os.makedirs(os.path.join(path, 'bin'), exist_ok=True)
+	os.makedirs(os.path.join(path, 'logs'), exist_ok=True)
+
+	with open(os.path.join(path, 'env', 'init.sh'), 'w') as fh:
+		pass
+
+	with open(os.path.join(path, 'config.sh'), 'w') as fh:
+		print('SBATCH_ACCOUNT={}'.format(ACCOUNT), file=fh)
+		print('declare -A COLLECTIONS=({})'.format(' '.join(
+			'[{}]={}'.format(name, os.path.join(path, 'data', name))
+			for name in COLLECTIONS)), file=fh)
+
+	for name in ['sacct', 'squeue', 'scontrol']:
+		filename = os.path.join(path, 'bin', name)
+		with open(filename, 'w') as fh:
+			print('#!{}'.format(sys.executable), file=fh)
+			print('import sys', file=fh)
+			print('sys.path.insert(0, {!r})'.format(REPO), file=fh)
+			print('import bench_dashboard', file=fh)
+			print('sys.exit(bench_dashboard.fake_{}(sys.argv[1:]))'.format(name), file=fh)
+		os.chmod(filename, 0o755)
+
+	now = datetime.now()
+	submit = now - timedelta(days=300)
+	job_id = 1000000
+	counts = {'jobs': 0, 'arrays': 0, 'active_jobs': 0}
+
+	with open(os.path.join(path, '.schedule-log'), 'w') as schedule_log, \
+		open(os.path.join(path, 'sacct.txt'), 'w') as sacct, \
+		open(os.path.join(path, 'squeue.txt'), 'w') as squeue:
+
+		print('|'.join(SACCT_COLUMNS), file=sacct)
+
+		while counts['jobs'] < jobs:
+			job_id += rng.randint(1, 20)
+			submit = min(now, submit + timedelta(seconds=rng.randint(1, int(300 * 86400 * 2 / (jobs / 500)))))
+			is_active = rng.random() < active
+
+			# Mostly array jobs, some reduce-* jobs that run once per language.
+			if rng.random() < 0.05:
+				name = 'reduce-tmx-{}'.format(rng.choice(LANGUAGES))
+				tasks = None
+			else:
+				name = '{}-{}-{}'.format(rng.choice(STEPS), rng.choice(LANGUAGES), rng.choice(COLLECTIONS))
+				tasks = min(rng.randint(1, 1000), jobs - counts['jobs'])
+
+			cpus = rng.choice([1, 2, 4, 8, 16, 128])
+			print('{} {} -J {} {}--time 24:00:00 --cpus-per-task {} -e logs/%A_%a.err -o logs/%A_%a.out {}.sh {}'.format(
+				submit.strftime('%Y%m%d%H%M%S'), job_id, name,
+				'-a 1-{} '.format(tasks) if tasks else '',
+				cpus, name.split('-')[0], os.path.join('data', name)), file=schedule_log)
+
+			common = {
+				'Account': ACCOUNT,
+				'AllocCPUS': cpus,
+				'NCPUS': cpus,
+				'ReqCPUS': cpus,
+				'AllocNodes': 1,
+				'NNodes': 1,
+				'ReqNodes': 1,
+				'AllocTRES': 'billing={0},cpu={0},mem={1}G,node=1'.format(cpus, cpus * 2),
+				'ReqTRES': 'billing={0},cpu={0},mem={1}G,node=1'.format(cpus, cpus * 2),
+				'ReqMem': '{}G'.format(cpus * 2),
+				'Cluster': 'lumi',
+				'GID': 1000,
+				'Group': ACCOUNT,
+				'UID': 1000,
+				'User': 'paracrawl',
+				'Partition': 'small',
+				'QOS': 'normal',
+				'Timelimit': '1-00:00:00',
+				'WorkDir': path,
+				'JobName': name,
+				'Submit': slurm_time(submit),
+				'Eligible': slurm_time(submit),
+			}
+
+			task_ids = list(range(1, tasks + 1)) if tasks else [None]
+			finished = rng.randint(0, len(task_ids)) if is_active else len(task_ids)
+			running = min(len(task_ids) - finished, rng.randint(1, 50)) if is_active else 0
+
+			for n, task_id in enumerate(task_ids[:finished + running]):
+				raw_id = job_id + n if task_id else job_id
+				display_id = '{}_{}'.format(job_id, task_id) if task_id else str(job_id)
+				elapsed = rng.randint(60, 86400)
+				start = submit + timedelta(seconds=rng.randint(0, 3600))
+				if n < finished:
+					state = rng.choices(['COMPLETED', 'FAILED', 'TIMEOUT', 'CANCELLED by 1000'], [95, 3, 1, 1])[0]
+					end = slurm_time(start + timedelta(seconds=elapsed))
+					exit_code = '0:0' if state == 'COMPLETED' else '1:0'
+				else:
+					state, end, exit_code = 'RUNNING', 'Unknown', '0:0'
+					elapsed = rng.randint(0, 3600)
+				values = dict(common,
+					JobID=display_id,
+					JobIDRaw=raw_id,
+					State=state,
+					Start=slurm_time(start),
+					End=end,
+					Elapsed=str(timedelta(seconds=elapsed)),
+					ElapsedRaw=elapsed,
+					CPUTimeRAW=elapsed * cpus,
+					ExitCode=exit_code,
+					DerivedExitCode=exit_code,
+					NodeList='nid{:06d}'.format(rng.randint(1, 2000)))
+				print(sacct_row(**values), file=sacct)
+				print(sacct_row(**dict(values, JobID=display_id + '.batch', JobIDRaw='{}.batch'.format(raw_id), JobName='batch')), file=sacct)
+
+				if n >= finished:
+					print('|'.join([display_id, str(task_id or 'N/A'), str(job_id) if task_id else display_id,
+						str(cpus), 'N/A', name, 'small', 'None', 'paracrawl', '0', 'RUNNING',
+						str(timedelta(seconds=elapsed)), values['NodeList']]), file=squeue)
+
+			# Tasks that haven't started yet show up collapsed, in both squeue and sacct.
+			if finished + running < len(task_ids):
+				first, last = finished + running + 1, len(task_ids)
+				if tasks:
+					pending_id = '{}_[{}-{}]'.format(job_id, first, last)
+					task_range = '{}-{}'.format(first, last)
+				else:
+					pending_id = str(job_id)
+					task_range = 'N/A'
+				print(sacct_row(**dict(common, JobID=pending_id, JobIDRaw=job_id, State='PENDING', Start='Unknown', End='Unknown', Elapsed='00:00:00', ElapsedRaw=0)), file=sacct)
+				print('|'.join([pending_id, task_range, str(job_id), str(cpus), 'N/A', name, 'small',
+					'Priority', 'paracrawl', '0', 'PENDING', '0:00', '']), file=squeue)
+
+			counts['jobs'] += len(task_ids)
+			counts['arrays'] += 1
+			if is_active:
+				counts['active_jobs'] += len(task_ids) - finished
+
+	return counts
+
+
+def parse_options(args:List[str]) -> Dict[str,str]:
+	"""Minimal getopt for the fake binaries: --key value, --key=value and -k value."""
+	options = {}
+	it = iter(args)
+	for arg in it:
+		if arg.startswith('--') and '=' in arg:
+			key, value = arg[2:].split('=', maxsplit=1)
+			options[key] = value
+		elif arg in {'--parsable2', '--details', '--noheader'}:
+			options[arg[2:]] = ''
+		elif arg.startswith('-'):
+			options[arg.lstrip('-')] = next(it, '')
+		else:
+			options.setdefault('', '')
+			options[''] += arg + ' '
+	return options
+
+
+def job_filter(job_ids:Optional[str]) -> Callable[[str],bool]:
+	"""Returns a predicate for job ids as printed by sacct and squeue that
+	matches the selection of --jobs, like Slurm does: an array job id selects
+	all of its tasks, an array task id only that task."""
+	if job_ids is None:
+		return lambda job_id: True
+
+	arrays: Set[str] = set()
+	tasks: Dict[str,Set[int]] = {}
+	for job_id in job_ids.split(','):
+		if '_' in job_id:
+			array_job_id, task_id = job_id.split('_', maxsplit=1)
+			tasks.setdefault(array_job_id, set()).add(int(task_id))
+		elif job_id:
+			arrays.add(job_id)
+
+	def selected(job_id:str) -> bool:
+		match = JOB_ID_PATTERN.match(job_id)
+		if not match:
+			return False
+		if match['array_job_id'] in arrays:
+			return True
+		if match['array_job_id'] not in tasks:
+			return False
+		if match['array_task_id']:
+			return int(match['array_task_id']) in tasks[match['array_job_id']]
+		if match['array_task_start']:
+			first, last = int(match['array_task_start']), int(match['array_task_end'])
+			return any(first <= task_id <= last for task_id in tasks[match['array_job_id']])
+		return False
+
+	return selected
+
+
+def read_data(name:str) -> TextIO:
+	# Slurm runs the commands in the cirrus-scripts directory they are for
+	return open(os.path.join(os.environ.get(DATA_VAR, os.getcwd()), name))
+
+
+# sacct --state codes
+STATE_CODES = {
+	'BF': 'BOOT_FAIL',
+	'CA': 'CANCELLED',
+	'CD': 'COMPLETED',
+	'DL': 'DEADLINE',
+	'F': 'FAILED',
+	'NF': 'NODE_FAIL',
+	'OOM': 'OUT_OF_MEMORY',
+	'PD': 'PENDING',
+	'PR': 'PREEMPTED',
+	'R': 'RUNNING',
+	'TO': 'TIMEOUT',
+}
+
+
+def fake_sacct(args:List[str]) -> int:
+	options = parse_options(args)
+	selected = job_filter(options.get('jobs', options.get('job', options.get('j'))))
+	names = set(options['name'].split(',')) if 'name' in options else None
+	states = {STATE_CODES.get(code, code) for code in options['state'].split(',')} if 'state' in options else None
+	start, end = options.get('starttime'), options.get('endtime')
+	out = sys.stdout
+	with read_data('sacct.txt') as fh:
+		header = next(fh)
+		out.write(header)
+		columns = header.rstrip('\n').split('|')
+		job_id_column, name_column = columns.index('JobID'), columns.index('JobName')
+		start_column, end_column = columns.index('Start'), columns.index('End')
+		state_column = columns.index('State')
+		last_job_id = None
+		for line in fh:
+			fields = line.split('|')
+			if not selected(fields[job_id_column]):
+				continue
+			# Steps have their own name, they come with their job
+			if '.' in fields[job_id_column]:
+				if fields[job_id_column].split('.')[0] != last_job_id:
+					continue
+				out.write(line)
+				continue
+			last_job_id = None
+			if names is not None and fields[name_column] not in names:
+				continue
+			if states is not None:
+				state = fields[state_column].split(' ')[0]
+				if state not in states:
+					continue
+				# Jobs that were in that state at some point in the window, which
+				# for jobs that ended means they ended in it
+				if state not in ('PENDING', 'RUNNING'):
+					if start and (fields[end_column] == 'Unknown' or fields[end_column] < start):
+						continue
+					if end and (fields[end_column] == 'Unknown' or fields[end_column] > end):
+						continue
+					out.write(line)
+					last_job_id = fields[job_id_column]
+					continue
+			# Jobs that were pending or running at some point in the window
+			if start and fields[end_column] != 'Unknown' and fields[end_column] < start:
+				continue
+			if end and fields[start_column] != 'Unknown' and fields[start_column] > end:
+				continue
+			out.write(line)
+			last_job_id = fields[job_id_column]
+	return 0
+
+
+def fake_squeue(args:List[str]) -> int:
+	options = parse_options(args)
+	selected = job_filter(options.get('jobs', options.get('j')))
+	codes = re.findall(r'%(?:\.?\d+)?(\w)', options.get('format', options.get('o', '%i|%j|%T')))
+	columns = list(SQUEUE_COLUMNS)
+	out = sys.stdout
+	out.write('|'.join(SQUEUE_COLUMNS[code] for code in codes) + '\n')
+	with read_data('squeue.txt') as fh:
+		for line in fh:
+			fields = line.rstrip('\n').split('|')
+			if selected(fields[0]):
+				row = dict(zip(columns, fields))
+				out.write('|'.join(row.get(code, '') for code in codes) + '\n')
+	return 0
+
+
+def fake_scontrol(args:List[str]) -> int:
+	job_id = args[-1]
+	columns = list(SQUEUE_COLUMNS)
+	with read_data('squeue.txt') as fh:
+		for line in fh:
+			row = dict(zip(columns, line.rstrip('\n').split('|')))
+			if row['i'] == job_id:
+				break
+		else:
+			print('slurm_load_jobs error: Invalid job id specified', file=sys.stderr)
+			return 1
+
+	print('JobId={} ArrayJobId={} ArrayTaskId={} JobName={}'.format(job_id, row['F'], row['K'], row['j']))
+	print('   UserId={}(1000) GroupId={}(1000) MCS_label=N/A'.format(row['u'], ACCOUNT))
+	print('   JobState={} Reason={} Dependency=(null)'.format(row['T'], row['r']))
+	print('   RunTime={} TimeLimit=1-00:00:00 TimeMin=N/A'.format(row['M']))
+	print('   Partition={} AllocNode:Sid=uan01:1 NodeList={}'.format(row['P'], row['N']))
+	print('   NumNodes=1 NumCPUs={} NumTasks=1 CPUs/Task={}'.format(row['C'], row['C']))
+	print('   Command={}'.format(os.path.join(os.environ.get(DATA_VAR, os.getcwd()), row['j'].split('-')[0] + '.sh')))
+	print('   StdErr={}'.format(os.path.join(os.environ.get(DATA_VAR, os.getcwd()), 'logs', job_id + '.err')))
+	print('   StdOut={}'.format(os.path.join(os.environ.get(DATA_VAR, os.getcwd()), 'logs', job_id + '.out')))
+	return 0
+
+
+def rss() -> Dict[str,float]:
+	"""Peak and current resident set size of this process in MiB."""
+	usage = {'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+	try:
+		with open('/proc/self/statm') as fh:
+			usage['rss_mb'] = int(fh.read().split()[1]) * resource.getpagesize() / 1024 / 1024
+	except OSError:
+		pass
+	return usage
+
+
+def response_size(response) -> int:
+	if hasattr(response, 'chunks'):
+		return sum(len(str(chunk).encode('utf-8', 'replace')) for chunk in response.chunks)
+	return len(str(response.body).encode('utf-8', 'replace'))
+
+
+def child() -> None:
+	"""Runs the stages in this process, which should have the fake
+	cirrus-scripts directory as working directory and the fakes on PATH.
+	Prints one json object per stage."""
+	def report(stage:str, fn:Callable[[],Any], measure:Callable[[Any],Dict[str,Any]] = lambda result: {}) -> Any:
+		start = time.perf_counter()
+		try:
+			result = fn()
+		except Exception as e:
+			print(json.dumps({'stage': stage, 'seconds': time.perf_counter() - start, 'error': repr(e), **rss()}), flush=True)
+			return None
+		print(json.dumps({'stage': stage, 'seconds': time.perf_counter() - start, **measure(result), **rss()}), flush=True)
+		return result
+
+	sys.path.insert(0, REPO)
+
+	dashboard = report('import dashboard', lambda: __import__('dashboard'))
+	if dashboard is None:
+		return
+
+	from web import Request
+
+	source = next(iter(dashboard.sources.values()))
+	slurm, state = source.slurm, source.state
+	since = datetime.now() - timedelta(days=365)
+
+	# What the poller does first: load all jobs of the last year.
+	report('State.load', lambda: state.load(since), lambda _: {'jobs': len(state.jobs.jobs)})
+	array_job_ids = report('Slurm.scheduled_jobs',
+		lambda: {job.get('ArrayJobId', job['JobId']) for job in slurm.scheduled_jobs(since=since)},
+		lambda ids: {'arrays': len(ids)})
+	report('Slurm.accounting_jobs',
+		lambda: sum(1 for _ in slurm.accounting_jobs(['--jobs', ','.join(array_job_ids or [])])),
+		lambda count: {'jobs': count})
+	report('Slurm.current_jobs',
+		lambda: sum(1 for _ in slurm.current_jobs(['--jobs', ','.join(array_job_ids or [])])),
+		lambda count: {'jobs': count})
+
+	report('State.update', state.update, lambda active: {'active_jobs': len(active.jobs)})
+	previous_update = state.last_update
+	report('State.update (again)', state.update, lambda active: {'active_jobs': len(active.jobs)})
+
+	report('JobList.filter', lambda: state.jobs.filter(lambda job: job.get('State') == 'FAILED'),
+		lambda jobs: {'jobs': len(jobs.jobs)})
+	report('JobList.update', lambda: state.jobs.update(dashboard.JobList(state.jobs.with_timestamp())))
+
+	report('list_jobs', lambda: dashboard.list_jobs(Request('GET', '/jobs/')),
+		lambda response: {'bytes': response_size(response)})
+	report('list_jobs (filtered)', lambda: dashboard.list_jobs(Request('GET', '/jobs/?language=de&step=translate&state=COMPLETED,RUNNING')),
+		lambda response: {'bytes': response_size(response)})
+	report('list_jobs_delta', lambda: dashboard.list_jobs(Request('GET', '/jobs/delta/'), timestamp=previous_update.isoformat()),
+		lambda response: {'bytes': response_size(response)})
+
+	report('summarize_jobs', lambda: dashboard.summarize_jobs(Request('GET', '/jobs/summary')),
+		lambda response: {'bytes': response_size(response)})
+
+	# A job that is still running, so scontrol has something to say about it
+	job_id = next((job['JobId'] for job in state.jobs if job.get('State') == 'RUNNING'), next(iter(state.jobs.job_ids())))
+	report('State.get_job', lambda: state.get_job(job_id), lambda job: {'fields': len(job)})
+
+	finished_job_id = next(iter(state.jobs.find(state=['COMPLETED'])), job_id)
+	report('State.get_job (finished)', lambda: state.get_job(finished_job_id), lambda job: {'fields': len(job)})
+	report('State.get_job (finished, again)', lambda: state.get_job(finished_job_id), lambda job: {'fields': len(job)})
+
+
+def run(scales:Iterable[int], workdir:Optional[str], active:float) -> Iterator[Dict[str,Any]]:
+	for scale in scales:
+		path = os.path.join(workdir or tempfile.mkdtemp(prefix='bench-dashboard-'), str(scale))
+		try:
+			start = time.perf_counter()
+			counts = generate(path, scale, active=active)
+			print('{}: generated {jobs} jobs in {arrays} submissions, {active_jobs} active, in {:.1f}s'.format(
+				scale, time.perf_counter() - start, **counts), file=sys.stderr)
+
+			env = dict(os.environ)
+			env.pop('LANGS', None)
+			env.pop('COLLECTIONS', None)
+			env.pop('SBATCH_ACCOUNT', None)
+			env['PATH'] = os.path.join(path, 'bin') + os.pathsep + env.get('PATH', '')
+
+			proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child'], cwd=path, env=env, stdout=subprocess.PIPE, text=True)
+			for line in proc.stdout:
+				result = {'scale': scale, **json.loads(line)}
+				print('{scale:>8} {stage:<32} {seconds:8.2f}s {peak_rss_mb:8.1f}MiB {extra}'.format(
+					extra=' '.join('{}={}'.format(key, value) for key, value in result.items() if key not in {'scale', 'stage', 'seconds', 'peak_rss_mb', 'rss_mb'}),
+					**result), file=sys.stderr)
+				yield result
+			proc.wait()
+		finally:
+			if not workdir:
+				shutil.rmtree(os.path.dirname(path))
+
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--scales', default='10000,100000,1000000', help='Comma separated numbers of jobs [default: %(default)s]')
+	parser.add_argument('--active', type=float, default=0.05, help='Fraction of submissions that is still pending or running [default: %(default)s]')
+	parser.add_argument('--workdir', help='Keep the generated data in this directory instead of a temporary one')
+	parser.add_argument('--output', '-o', help='Write the results as json to this file')
+	parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.child:
+		child()
+		return
+
+	results = list(run([int(scale) for scale in args.scales.split(',')], args.workdir, args.active))
+
+	if args.output:
+		with open(args.output, 'w') as fh:
+			json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""Measures the request overhead of web.py over loopback.
+
+Starts an Application with a couple of representative routes in a separate
+process, and hammers each of them from a pool of client threads at
+increasing levels of concurrency. Reports requests per second and the p50
+and p99 latency of each scenario, and can write them as json so you can
+compare them across commits:
+
+	cp bench_web.py /tmp/
+	python3 /tmp/bench_web.py --output after.json
+	git checkout HEAD~10
+	python3 /tmp/bench_web.py --output before.json
+
+It uses the web.py of the working directory. Versions of web.py without
+StreamResponse skip the chunked_stream scenario.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+import tempfile
+import http.client
+from functools import partial
+from http.server import ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+# The web.py we measure is the one of the checkout we're run in
+sys.path.insert(0, os.getcwd())
+
+from web import Application, FileResponse, RequestHandler, send_file, send_json
+
+try:
+	from web import StreamResponse
+except ImportError: # web.py from before it had one
+	StreamResponse = None
+
+
+class Scenario(NamedTuple):
+	name: str
+	path: str
+
+
+SCENARIOS = [
+	Scenario('small_json', '/json/small'),
+	Scenario('large_json', '/json/large'),
+	Scenario('static_file', '/static/page.html'),
+	Scenario('file_stream', '/stream/file'),
+	*([Scenario('chunked_stream', '/stream/chunked')] if StreamResponse else []),
+]
+
+# Size of the large json response, the static file and the streams.
+LARGE_SIZE = 1024 * 1024
+
+STREAM_CHUNK = 16 * 1024
+
+
+class PipeStream:
+	"""Pipe that is fed by a thread, like the output of `tail -f` that the
+	dashboard streams through FileResponse."""
+	def __init__(self, size:int, chunk_size:int = STREAM_CHUNK):
+		self.read_fd, write_fd = os.pipe()
+		self.thread = threading.Thread(target=self._feed, args=(write_fd, size, chunk_size), daemon=True)
+		self.thread.start()
+
+	def _feed(self, fd:int, size:int, chunk_size:int) -> None:
+		chunk = b'x' * chunk_size
+		try:
+			for _ in range(size // chunk_size):
+				os.write(fd, chunk)
+		except BrokenPipeError:
+			pass
+		finally:
+			os.close(fd)
+
+	def fileno(self) -> int:
+		return self.read_fd
+
+	def read(self) -> bytes:
+		try:
+			return os.read(self.read_fd, 65536)
+		except BlockingIOError:
+			return b''
+
+	def close(self) -> None:
+		if self.read_fd >= 0:
+			os.close(self.read_fd)
+			self.read_fd = -1
+
+
+def make_app(static_dir:str) -> Application:
+	app = Application()
+
+	small = {'id': '1234567_89', 'step': 'translate', 'language': 'de', 'collection': 'wide00006'}
+	large = [dict(small, id='1234567_{}'.format(n)) for n in range(LARGE_SIZE // 90)]
+
+	@app.route('/json/small')
+	def json_small(request):
+		return send_json(small)
+
+	@app.route('/json/large')
+	def json_large(request):
+		return send_json(large)
+
+	@app.route('/static/<path:filename>')
+	def static_file(request, filename):
+		return send_file(os.path.join(static_dir, filename))
+
+	@app.route('/stream/file')
+	def file_stream(request):
+		return FileResponse(PipeStream(LARGE_SIZE))
+
+	if StreamResponse:
+		@app.route('/stream/chunked')
+		def chunked_stream(request):
+			chunk = 'x' * 1024
+			return StreamResponse(chunk for _ in range(LARGE_SIZE // len(chunk)))
+
+	return app
+
+
+def serve() -> None:
+	"""Runs the benchmark server on a free loopback port, and tells the parent
+	process which one by printing it."""
+	with tempfile.TemporaryDirectory() as static_dir:
+		with open(os.path.join(static_dir, 'page.html'), 'w') as fh:
+			fh.write('<p>{}</p>\n'.format('x' * 1024) * (LARGE_SIZE // 1032))
+
+		app = make_app(static_dir)
+		server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietRequestHandler, app=app))
+		print(server.server_address[1], flush=True)
+		server.serve_forever()
+
+
+class QuietRequestHandler(RequestHandler):
+	def log_message(self, format, *args):
+		pass
+
+
+def percentile(values:List[float], fraction:float) -> Optional[float]:
+	if not values:
+		return None
+	return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def load(port:int, path:str, concurrency:int, duration:float) -> Dict[str,Any]:
+	"""Requests `path` from `concurrency` threads for `duration` seconds."""
+	latencies: List[List[float]] = [[] for _ in range(concurrency)]
+	errors = [0] * concurrency
+	received = [0] * concurrency
+	deadline = time.perf_counter() + duration
+
+	def worker(n:int) -> None:
+		while time.perf_counter() < deadline:
+			start = time.perf_counter()
+			try:
+				connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+				connection.request('GET', path)
+				response = connection.getresponse()
+				received[n] += len(response.read())
+				connection.close()
+				if response.status != 200:
+					errors[n] += 1
+					continue
+			except (OSError, http.client.HTTPException):
+				errors[n] += 1
+				continue
+			latencies[n].append(time.perf_counter() - start)
+
+	start = time.perf_counter()
+	threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	elapsed = time.perf_counter() - start
+
+	measured = sorted(latency for worker_latencies in latencies for latency in worker_latencies)
+	return {
+		'requests': len(measured),
+		'errors': sum(errors),
+		'seconds': elapsed,
+		'bytes': sum(received),
+		'requests_per_second': len(measured) / elapsed,
+		'p50_ms': (percentile(measured, 0.5) or 0) * 1000,
+		'p99_ms': (percentile(measured, 0.99) or 0) * 1000,
+	}
+
+
+def git_commit() -> Optional[str]:
+	try:
+		return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+			stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def run(scenarios:Iterable[Scenario], levels:Iterable[int], duration:float) -> List[Dict[str,Any]]:
+	server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve'], stdout=subprocess.PIPE, text=True)
+	try:
+		port = int(server.stdout.readline())
+		results = []
+		for scenario in scenarios:
+			load(port, scenario.path, 1, min(duration, 0.5)) # warm up
+			for concurrency in levels:
+				result = {'scenario': scenario.name, 'concurrency': concurrency, **load(port, scenario.path, concurrency, duration)}
+				print('{scenario:<16} {concurrency:>4} {requests_per_second:10.1f} req/s  p50 {p50_ms:8.2f}ms  p99 {p99_ms:8.2f}ms  {errors} errors'.format(**result), file=sys.stderr)
+				results.append(result)
+		return results
+	finally:
+		server.terminate()
+		server.wait()
+
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--concurrency', '-c', default='1,4,16,64', help='Comma separated numbers of concurrent clients [default: %(default)s]')
+	parser.add_argument('--duration', '-d', type=float, default=3.0, help='Seconds to run each scenario at each concurrency level [default: %(default)s]')
+	parser.add_argument('--scenario', '-s', action='append', choices=[scenario.name for scenario in SCENARIOS], help='Only run these scenarios [default: all]')
+	parser.add_argument('--output', '-o', help='Write the results as json to this file')
+	parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.serve:
+		serve()
+		return
+
+	scenarios = [scenario for scenario in SCENARIOS if not args.scenario or scenario.name in args.scenario]
+	results = run(scenarios, [int(level) for level in args.concurrency.split(',')], args.duration)
+
+	if args.output:
+		with open(args.output, 'w') as fh:
+			json.dump({
+				'commit': git_commit(),
+				'python': sys.version.split()[0],
+				'duration': args.duration,
+				'results': results,
+			}, fh, indent=2)
+
+
+if __name__ == '__main__':
+	main()
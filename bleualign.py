@@ -1,20 +1,138 @@
 #!/usr/bin/env python3
 import os
+import sys
 import gzip
+import mmap
+import time
+import json
+import struct
+from array import array
+from hashlib import blake2b
+from tempfile import gettempdir
 from base64 import b64decode
 from glob import glob
-from collections import defaultdict
+from itertools import islice
+from threading import Lock
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+import gzindex
 from web import Application, Response, send_file, send_json, main
 
 
-class lazydict(dict):
-	"""Like defaultdict, but passes the key to the default_factory in __missing__()."""
-	def __init__(self, default_factory):
-		super().__init__()
-		self.factory = default_factory
+K = TypeVar('K', bound=Hashable)
+
+V = TypeVar('V')
+
 
-	def __missing__(self, key):
-		return self.factory(key)
+def approximate_size(obj:Any, sample:int = 1000) -> int:
+	"""Rough memory footprint of obj and everything in it. Large containers
+	are estimated from their first few items."""
+	size = sys.getsizeof(obj)
+	if isinstance(obj, (str, bytes, int, float)) or obj is None:
+		return size
+	if isinstance(obj, dict):
+		items = list(islice(obj.items(), sample))
+		item_size = sum(approximate_size(key, sample) + approximate_size(val, sample) for key, val in items)
+	elif isinstance(obj, (list, tuple, set, frozenset)):
+		items = list(islice(obj, sample))
+		item_size = sum(approximate_size(item, sample) for item in items)
+	else:
+		return size
+	if items:
+		size += item_size * len(obj) // len(items)
+	return size
+
+
+class lazycache(Generic[K,V]):
+	"""Like defaultdict, but passes the key to the default_factory, and only
+	keeps as many values around as fit in max_size bytes, dropping the least
+	recently used ones first. Safe to use from multiple threads: when several
+	ask for the same missing key at once, only one of them calls the factory
+	and the others wait for its result."""
+	def __init__(self, default_factory:Callable[[K],V], max_size:int, sizeof:Callable[[V],int] = approximate_size):
+		self.factory = default_factory
+		self.sizeof = sizeof
+		self.max_size = max_size
+		self.entries: 'OrderedDict[K,Tuple[V,int]]' = OrderedDict()
+		self.pending: Dict[K,Future] = {}
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self.waits = 0 # misses that waited for another thread to make the value
+		self.evictions = 0
+		self.lock = Lock()
+
+	def __getitem__(self, key:K) -> V:
+		return self.get(key)
+
+	def get(self, key:K, evict:bool = True) -> V:
+		"""Same as cache[key], but with evict=False a value that was just made
+		is only kept if it fits without dropping others."""
+		with self.lock:
+			if key in self.entries:
+				self.hits += 1
+				self.entries.move_to_end(key)
+				return self.entries[key][0]
+			elif key in self.pending:
+				self.waits += 1
+				future, owner = self.pending[key], False
+			else:
+				self.misses += 1
+				future, owner = Future(), True
+				self.pending[key] = future
+
+		if not owner:
+			return future.result()
+
+		try:
+			value = self.factory(key)
+			size = self.sizeof(value)
+		except BaseException as e:
+			with self.lock:
+				del self.pending[key]
+			future.set_exception(e)
+			raise
+
+		with self.lock:
+			del self.pending[key]
+			if evict or self.size + size <= self.max_size:
+				self.entries[key] = (value, size)
+				self.size += size
+				# Make room, but always keep the value we just made
+				while self.size > self.max_size and len(self.entries) > 1:
+					_, (_, evicted_size) = self.entries.popitem(last=False)
+					self.size -= evicted_size
+					self.evictions += 1
+
+		future.set_result(value)
+		return value
+
+	def __contains__(self, key:K) -> bool:
+		with self.lock:
+			return key in self.entries
+
+	def stats(self) -> Dict[str,Any]:
+		with self.lock:
+			return {
+				'entries': {repr(key): size for key, (_, size) in self.entries.items()},
+				'building': [repr(key) for key in self.pending],
+				'size': self.size,
+				'max_size': self.max_size,
+				'hits': self.hits,
+				'misses': self.misses,
+				'waits': self.waits,
+				'evictions': self.evictions,
+			}
+
+
+# Memory each of the index caches may use, in megabytes
+CACHE_SIZE = int(os.getenv('INDEX_CACHE_MB', '1024')) * 1000 * 1000
+
+# Decompressed megabytes between gzip checkpoints, i.e. the most we need to
+# decompress to get to any document.
+CHECKPOINT_SPAN = int(os.getenv('CHECKPOINT_MB', '16')) * 1024 * 1024
 
 
 def index_document(filename):
@@ -41,53 +159,365 @@ def index_document(filename):
 	return offsets
 
 
+class IndexProgress:
+	"""How far along building the index of a file is."""
+	def __init__(self, filename):
+		self.filename = filename
+		self.size = os.path.getsize(filename)
+		self.processed = 0
+		self.started = None
+		self.finished = None
+		self.error = None
+
+	def start(self):
+		self.started, self.finished, self.error = time.time(), None, None
+		self.processed = 0
+
+	def update(self, processed):
+		self.processed = processed
+
+	def finish(self, error=None):
+		self.finished = time.time()
+		self.error = repr(error) if error else None
+		if not error:
+			self.processed = self.size
+
+	def as_dict(self):
+		if self.error:
+			state = 'failed'
+		elif self.finished:
+			state = 'ready'
+		elif self.started:
+			state = 'indexing'
+		else:
+			state = 'waiting'
+
+		eta = None
+		if state == 'indexing' and self.processed:
+			elapsed = time.time() - self.started
+			eta = elapsed / self.processed * (self.size - self.processed)
+
+		return {
+			'filename': self.filename,
+			'state': state,
+			'bytes_processed': self.processed,
+			'bytes_total': self.size,
+			'eta': eta,
+			'error': self.error,
+		}
+
+
+progress: Dict[str,IndexProgress] = {}
+
+progress_lock = Lock()
+
+
+def get_progress(filename):
+	with progress_lock:
+		if filename not in progress:
+			progress[filename] = IndexProgress(filename)
+		return progress[filename]
+
+
+@contextmanager
+def indexing(filename):
+	progress = get_progress(filename)
+	progress.start()
+	try:
+		yield progress
+	except BaseException as e:
+		progress.finish(e)
+		raise
+	else:
+		progress.finish()
+
+
+def sidecar_paths(filename:str, suffix:str) -> List[str]:
+	"""Where an index of filename is stored: next to it, or in the temp dir if
+	that is not writable."""
+	return [
+		filename + suffix,
+		os.path.join(gettempdir(), 'bleualign-{}{}'.format(blake2b(os.path.realpath(filename).encode(), digest_size=8).hexdigest(), suffix))
+	]
+
+
+class DocumentIndex(list):
+	"""List of (offset, src_url, trg_url) per document, together with the
+	gzip checkpoints that were left behind while reading the file, so getting
+	to an offset does not mean decompressing everything before it.
+
+	Stored in a sidecar file as a json header with the size and mtime of the
+	input file and its gzip member offsets, followed by a line per document
+	with its offset and url pair."""
+	SUFFIX = '.docidx'
+
+	VERSION = 1
+
+	def __init__(self, offsets, checkpoints:gzindex.GzipIndex):
+		super().__init__(offsets)
+		self.checkpoints = checkpoints
+
+	@classmethod
+	def load(cls, path:str, filename:str, key:List[int]) -> Optional['DocumentIndex']:
+		try:
+			with open(path, 'rb') as fh:
+				header = json.loads(fh.readline())
+				if header.get('version') != cls.VERSION or header['file'] != key:
+					return None
+				offsets = []
+				for line in fh:
+					pos, src_url, trg_url = line.rstrip(b'\n').split(b'\t')
+					offsets.append((int(pos), src_url.decode(), trg_url.decode()))
+		except (OSError, ValueError, KeyError):
+			return None
+
+		# Written by someone that didn't get to finish
+		if len(offsets) != header['documents']:
+			return None
+
+		checkpoints = gzindex.make_index(filename, CHECKPOINT_SPAN)
+		for offset, raw_offset in header['members']:
+			checkpoints.add(offset, raw_offset, None)
+		return cls(offsets, checkpoints)
+
+	def save(self, path:str, key:List[int]) -> bool:
+		header = {
+			'version': self.VERSION,
+			'file': key,
+			'documents': len(self),
+			'members': self.checkpoints.members(),
+		}
+		try:
+			with open(path + '.tmp', 'wb') as fh:
+				fh.write(json.dumps(header).encode() + b'\n')
+				for pos, src_url, trg_url in self:
+					fh.write(b'%d\t%s\t%s\n' % (pos, src_url.encode(), trg_url.encode()))
+			os.replace(path + '.tmp', path)
+		except OSError:
+			return False
+		return True
+
+
+def split_url_pair(line):
+	"""(src_url, trg_url) of a line of an input or aligned file, or None."""
+	pos_src_url = line.find(b'\t')
+	pos_trg_url = line.find(b'\t', pos_src_url + 1)
+	if pos_src_url == -1 or pos_trg_url == -1:
+		return None
+	return line[:pos_src_url], line[pos_src_url+1:pos_trg_url]
+
+
+# Processes that BGZF files are decompressed on. Made in __main__ before the
+# server starts, so that there is one pool for all requests and it isn't
+# forked from the server's threads. Without it files are scanned in the
+# thread that asks for them.
+scan_pool: Optional[ProcessPoolExecutor] = None
+
+
+def scan_url_pairs(filename, index, progress):
+	"""Offset and url pair of every line, decompressed in parallel if we can."""
+	return gzindex.scan_lines(filename, split_url_pair, index=index, progress=progress.update, pool=scan_pool)
+
+
+def fill_checkpoints(filename, checkpoints, progress):
+	"""Decompress filename once to leave checkpoints behind, for an index that
+	was loaded from disk. Not needed for BGZF files, of which the index
+	already knows every block."""
+	if checkpoints.blocks is not None:
+		return
+	with gzindex.open(filename, checkpoints, progress=progress.update) as fh:
+		while fh.read(1024 * 1024):
+			pass
+
+
 def index_document_2(filename):
+	stat = os.stat(filename)
+	key = [stat.st_size, stat.st_mtime_ns]
+	paths = sidecar_paths(filename, DocumentIndex.SUFFIX)
+
+	for path in paths:
+		index = DocumentIndex.load(path, filename, key)
+		if index is not None:
+			with indexing(filename) as progress:
+				fill_checkpoints(filename, index.checkpoints, progress)
+			return index
+
 	offsets = []
-	with gzip.open(filename, 'rb') as fh:
-		pos = 0
-		for line in fh:
-			pos_src_url = line.find(b'\t')
-			pos_trg_url = line.find(b'\t', pos_src_url + 1)
-			if pos_src_url != -1 and pos_trg_url != -1:
-				offsets.append((pos, line[:pos_src_url].decode(), line[pos_src_url+1:pos_trg_url].decode()))
-			pos += len(line)
-	return offsets
+	checkpoints = gzindex.make_index(filename, CHECKPOINT_SPAN)
+	with indexing(filename) as progress:
+		for pos, pair in scan_url_pairs(filename, checkpoints, progress):
+			if pair is not None:
+				offsets.append((pos, pair[0].decode(), pair[1].decode()))
+	index = DocumentIndex(offsets, checkpoints)
+
+	# First place we can write to. If there is none, it's memory only.
+	any(index.save(path, key) for path in paths)
+	return index
+
 
+def document_index_size(index):
+	return approximate_size(index) + sys.getsizeof(index.checkpoints)
 
-indexes = lazydict(index_document_2)
+
+indexes = lazycache(index_document_2, CACHE_SIZE, sizeof=document_index_size)
 
 def get_aligned_filename(filename):
-	pos = filename.find('-bleualign-input.tab.gz')
+	dirname, basename = os.path.split(filename)
+	pos = basename.find('-bleualign-input.tab.gz')
 	if pos == -1:
 		return None
-	aligned_filename = os.path.join('..', 'aligned', filename[:pos] + '-aligned.gz')
+	aligned_filename = os.path.join(dirname, '..', 'aligned', basename[:pos] + '-aligned.gz')
 	if not os.path.exists(aligned_filename):
 		return None
 	return aligned_filename
 
 
+def url_pair_hash(src_url:bytes, trg_url:bytes) -> int:
+	return int.from_bytes(blake2b(src_url + b'\t' + trg_url, digest_size=8).digest(), 'little')
+
+
+class UrlPairIndex:
+	"""Maps (src_url, trg_url) to the lines in an aligned file for that
+	document pair. Stored next to the aligned file (or in the temp dir if that
+	is not writable) as an open addressing hash table, and memory-mapped when
+	used, so it is only built once and costs no memory of its own. The gzip
+	checkpoints into the aligned file are kept with it, and are made again
+	when the table is loaded from disk, as they can't be stored.
+
+	Aligned sentences of a document pair are normally on consecutive lines,
+	so the table stores runs of lines: their offset and the number of lines.
+
+	Layout, all little-endian 64-bit:
+		header: magic, file size, file mtime, number of slots, number of runs
+		slots: index + 1 of the first run with that hash slot, or 0 if empty
+		runs: hashes, offsets, line counts
+	"""
+	MAGIC = b'URLPAIR1'
+
+	SUFFIX = '.urlidx'
+
+	HEADER = struct.Struct('<8sQqQQ')
+
+	def __init__(self, filename:str):
+		self.filename = filename
+		stat = os.stat(filename)
+		self.key = (stat.st_size, stat.st_mtime_ns)
+		self.checkpoints = gzindex.make_index(filename, CHECKPOINT_SPAN)
+		for path in self._paths():
+			if self._load(path):
+				with indexing(filename) as progress:
+					fill_checkpoints(filename, self.checkpoints, progress)
+				break
+		else:
+			with indexing(filename) as progress:
+				self._build(progress)
+
+	def _paths(self) -> List[str]:
+		return sidecar_paths(self.filename, self.SUFFIX)
+
+	def _load(self, path:str) -> bool:
+		try:
+			with open(path, 'rb') as fh:
+				magic, size, mtime, n_slots, n_runs = self.HEADER.unpack(fh.read(self.HEADER.size))
+				if magic != self.MAGIC or (size, mtime) != self.key:
+					return False
+				data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+		except (OSError, ValueError, struct.error):
+			return False
+
+		# A sidecar that was cut short (or isn't ours) is built again
+		if len(data) != self.HEADER.size + 8 * (n_slots + 3 * n_runs):
+			data.close()
+			return False
+
+		table = memoryview(data)[self.HEADER.size:].cast('Q')
+		self.slots = table[:n_slots]
+		self.hashes = table[n_slots:n_slots + n_runs]
+		self.offsets = table[n_slots + n_runs:n_slots + 2 * n_runs]
+		self.counts = table[n_slots + 2 * n_runs:n_slots + 3 * n_runs]
+		return True
+
+	def _build(self, progress:IndexProgress) -> None:
+		hashes, offsets, counts = array('Q'), array('Q'), array('Q')
+
+		last_pair = None
+		for pos, pair in scan_url_pairs(self.filename, self.checkpoints, progress):
+			if pair is None:
+				last_pair = None
+			elif pair == last_pair:
+				counts[-1] += 1
+			else:
+				hashes.append(url_pair_hash(*pair))
+				offsets.append(pos)
+				counts.append(1)
+				last_pair = pair
+
+		n_slots = 1
+		while n_slots < 2 * len(hashes):
+			n_slots *= 2
+
+		slots = array('Q', bytes(8 * n_slots))
+		for run, pair_hash in enumerate(hashes):
+			slot = pair_hash & (n_slots - 1)
+			while slots[slot]:
+				slot = (slot + 1) & (n_slots - 1)
+			slots[slot] = run + 1
+
+		for path in self._paths():
+			try:
+				with open(path + '.tmp', 'wb') as fh:
+					fh.write(self.HEADER.pack(self.MAGIC, *self.key, n_slots, len(hashes)))
+					for table in [slots, hashes, offsets, counts]:
+						table.tofile(fh)
+				os.replace(path + '.tmp', path)
+			except OSError:
+				continue
+			if self._load(path):
+				return
+
+		# Could not write it anywhere, keep it in memory then.
+		self.slots, self.hashes, self.offsets, self.counts = slots, hashes, offsets, counts
+
+	def lookup(self, src_url:str, trg_url:str) -> List[Tuple[int,int]]:
+		"""(offset, number of lines) of each run of lines for this url pair."""
+		pair_hash = url_pair_hash(src_url.encode(), trg_url.encode())
+		mask = len(self.slots) - 1
+		slot = pair_hash & mask
+		runs = []
+		while self.slots[slot]:
+			run = self.slots[slot] - 1
+			if self.hashes[run] == pair_hash:
+				runs.append((self.offsets[run], self.counts[run]))
+			slot = (slot + 1) & mask
+		return runs
+
+	def count(self, src_url:str, trg_url:str) -> int:
+		return sum(count for _, count in self.lookup(src_url, trg_url))
+
+	def __sizeof__(self) -> int:
+		# Only counts what is not memory-mapped, and the gzip checkpoints
+		return object.__sizeof__(self) + sys.getsizeof(self.checkpoints) \
+			+ sum(sys.getsizeof(table) for table in [self.slots, self.hashes, self.offsets, self.counts] if isinstance(table, array))
+
+
 def index_aligned_document(filename):
 	aligned_filename = get_aligned_filename(filename)
 	if not aligned_filename:
-		return {}
-	index = indexes[aligned_filename]
-	reverse_index = defaultdict(list)
-	for offset, src_url, trg_url in index:
-		reverse_index[(src_url, trg_url)].append(offset)
-	return reverse_index
+		return None
+	return UrlPairIndex(aligned_filename)
 
 
-def get_aligned_sentences(filename, offsets):
-	aligned_filename = get_aligned_filename(filename)
-	if not aligned_filename or not offsets:
-		return []
-	with gzip.open(aligned_filename, 'rb') as fh:
-		for offset in offsets:
+def get_aligned_sentences(aligned_index, runs):
+	if not runs:
+		return
+	with gzindex.open(aligned_index.filename, aligned_index.checkpoints) as fh:
+		for offset, count in runs:
 			fh.seek(offset)
-			yield tuple(col.decode().lstrip() for col in fh.readline().rstrip(b'\n').split(b'\t', maxsplit=4))
+			for _ in range(count):
+				yield tuple(col.decode().lstrip() for col in fh.readline().rstrip(b'\n').split(b'\t', maxsplit=4))
 
 
-aligned_indexes = lazydict(index_aligned_document)
+aligned_indexes = lazycache(index_aligned_document, CACHE_SIZE, sizeof=sys.getsizeof)
 
 
 def ltrim(items):
@@ -99,7 +529,7 @@ def ltrim(items):
 def get_document(filename, index):
 	offsets = indexes[filename]
 	assert index < len(offsets)
-	with gzip.open(filename, 'rb') as fh:
+	with gzindex.open(filename, offsets.checkpoints) as fh:
 		fh.seek(offsets[index][0])
 		cols = fh.readline().split(b'\t')
 		return {
@@ -114,8 +544,12 @@ def get_document(filename, index):
 
 def get_document_with_aligned(filename, index):
 	doc = get_document(filename, index)
-	aligned_offsets = aligned_indexes[filename].get((doc['url_src'], doc['url_trg']), [])
-	rows = list(get_aligned_sentences(filename, aligned_offsets))
+	aligned_index = aligned_indexes[filename]
+	runs = aligned_index.lookup(doc['url_src'], doc['url_trg']) if aligned_index else []
+	rows = [
+		row for row in get_aligned_sentences(aligned_index, runs)
+		if row[:2] == (doc['url_src'], doc['url_trg']) # in case of a hash collision
+	]
 	if rows:
 		_, _, doc['aligned_src'], doc['aligned_trg'], doc['aligned_scores'] = zip(*rows)
 	else:
@@ -123,6 +557,17 @@ def get_document_with_aligned(filename, index):
 	return doc
 
 
+def url_domain(url):
+	"""Netloc of scheme://netloc/path urls, without going through urlparse."""
+	parts = url.split('/', 3)
+	return parts[2] if len(parts) > 2 and parts[0].endswith(':') and parts[1] == '' else ''
+
+
+def in_domain(url, domain):
+	host = url_domain(url).rpartition('@')[2].partition(':')[0]
+	return host == domain or host.endswith('.' + domain)
+
+
 def human_filesize(size):
 	for suffix in ['B', 'K', 'M', 'G', 'T']:
 		if size < 1000:
@@ -133,32 +578,124 @@ def human_filesize(size):
 
 app = Application()
 
+# Most documents returned by one request to /files/<filename>/
+DOCUMENT_LIMIT = 1000
+
 
 @app.route('/')
 def index(request):
 	return send_file(os.path.join(os.path.dirname(__file__), 'bleualign.html'))
 
 
+def list_input_files():
+	return sorted(glob('*-bleualign-input.tab.gz'))
+
+
+def is_built(filename):
+	progress = get_progress(filename)
+	return progress.finished is not None and progress.error is None
+
+
+def is_ready(filename):
+	"""Whether the indexes for filename have been built. They may have been
+	evicted from the caches since, but then they are loaded from their
+	sidecars again."""
+	aligned_filename = get_aligned_filename(filename)
+	return is_built(filename) and (aligned_filename is None or is_built(aligned_filename))
+
+
+def prebuild(cache, filename):
+	"""Build cache[filename] if it fits in the cache. Prebuilding more than
+	that would only push out indexes we built before, so those files are
+	indexed when they are asked for instead."""
+	if cache.size < cache.max_size:
+		cache.get(filename, evict=False)
+
+
+def build_indexes(pool):
+	"""Index files on pool, as many as fit in the caches, so they're ready by
+	the time we ask for them."""
+	for filename in list_input_files():
+		get_progress(filename)
+		pool.submit(prebuild, indexes, filename)
+		aligned_filename = get_aligned_filename(filename)
+		if aligned_filename:
+			get_progress(aligned_filename)
+			pool.submit(prebuild, aligned_indexes, filename)
+
+
 @app.route('/files/')
 def list_files(request):
 	return send_json([
 		{
 			'name': '{} ({})'.format(filename, human_filesize(os.path.getsize(filename))),
-			'link': app.url_for('list_documents', filename=filename, index=1)
-		} for filename in sorted(glob('*-bleualign-input.tab.gz'))
+			'link': app.url_for('list_documents', filename=filename, index=1),
+			'status': app.url_for('show_status', filename=filename),
+			'ready': is_ready(filename)
+		} for filename in list_input_files()
 	])
 
 
+@app.route('/files/<str:filename>/status')
+def show_status(request, filename):
+	if not os.path.exists(filename):
+		return Response('File not found: {}'.format(filename), 404)
+	aligned_filename = get_aligned_filename(filename)
+	return send_json({
+		'ready': is_ready(filename),
+		'document': get_progress(filename).as_dict(),
+		'aligned': get_progress(aligned_filename).as_dict() if aligned_filename else None,
+	})
+
+
+@app.route('/stats/')
+def show_stats(request):
+	return send_json({
+		'indexes': indexes.stats(),
+		'aligned_indexes': aligned_indexes.stats(),
+	})
+
+
 @app.route('/files/<str:filename>/')
 def list_documents(request, filename):
+	try:
+		offset = max(0, int(request.args.get('offset', 0)))
+		limit = max(0, min(int(request.args.get('limit', DOCUMENT_LIMIT)), DOCUMENT_LIMIT))
+	except ValueError as e:
+		return Response('Invalid offset or limit: {}'.format(e), 400)
+	query = request.args.get('q')
+	domain = request.args.get('domain')
+
+	index = indexes[filename]
 	aligned_index = aligned_indexes[filename]
 
-	return send_json([
-		{
-			'name': '{}: {} - {}{}'.format(n, src_url, trg_url, ' ({})'.format(len(aligned_index[(src_url,trg_url)])) if (src_url, trg_url) in aligned_index else ''),
-			'link': app.url_for('show_document', filename=filename, index=n)
-		} for n, (offset, src_url, trg_url) in enumerate(indexes[filename])
-	])
+	if query or domain:
+		matches = [
+			n for n, (_, src_url, trg_url) in enumerate(index)
+			if (not query or query in src_url or query in trg_url)
+			and (not domain or in_domain(src_url, domain) or in_domain(trg_url, domain))
+		]
+		total = len(matches)
+		selection = matches[offset:offset + limit]
+	else:
+		total = len(index)
+		selection = range(offset, min(offset + limit, total))
+
+	def aligned_count(src_url, trg_url):
+		count = aligned_index.count(src_url, trg_url) if aligned_index else 0
+		return ' ({})'.format(count) if count else ''
+
+	return send_json({
+		'total': total,
+		'offset': offset,
+		'limit': limit,
+		'documents': [
+			{
+				'name': '{}: {} - {}{}'.format(n, src_url, trg_url, aligned_count(src_url, trg_url)),
+				'link': app.url_for('show_document', filename=filename, index=n)
+			} for n, (_, src_url, trg_url) in ((n, index[n]) for n in selection)
+		]
+	})
 
 
 @app.route('/files/<str:filename>/<int:index>')
@@ -167,4 +704,9 @@ def show_document(request, filename, index):
 
 
 if __name__ == '__main__':
+	workers = os.cpu_count() or 1
+	scan_pool = ProcessPoolExecutor(max_workers=workers)
+	# Start its processes now, while this is still the only thread
+	list(scan_pool.map(abs, range(workers)))
+	build_indexes(ThreadPoolExecutor(max_workers=int(os.getenv('INDEX_WORKERS', '4'))))
 	main(app)
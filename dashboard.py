@@ -4,10 +4,18 @@ import sys
 import os
 import subprocess
 import json
+import gzip
+import threading
+import time
+import traceback
+import mmap
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, Future, wait
+from collections import OrderedDict
+from glob import glob
 from itertools import chain
 from datetime import datetime, timedelta
 from pprint import pprint
-from web import Application, Response, FileResponse, main, send_file, send_json, URLConverter
+from web import Application, Response, FileResponse, StreamResponse, main, send_file, send_json, URLConverter
 from typing import Any, Callable, TypeVar, Optional, Dict, Tuple, List, Iterable, Iterator, Set, Union
 
 
@@ -33,13 +41,15 @@ class Job(dict):
 	__slots__ = (
 		'step',
 		'language',
-		'collection'
+		'collection',
+		'source'
 	)
 
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
 		
 		self.step, self.language, self.collection = None, None, None
+		self.source: Optional[str] = None
 
 		if 'JobName' in self:
 			if match := re.match(r'^(shard|merge-shard|clean-shard|dedupe|split|translate|tokenise|align|fix|score|clean|)-([a-z]{2,3}(?:-[A-Z][a-z]+)?)-([a-z]+[a-z0-9_\-]*)$', self['JobName']):
@@ -71,33 +81,72 @@ class Collection:
 		)
 
 
+# Job ids as printed by sacct: plain jobs, array tasks and collapsed arrays of
+# pending tasks. Job steps like 123_4.batch don't match.
+SACCT_JOB_ID = re.compile(r'^(?P<array_job_id>\d+)(?:_(?P<array_task_id>\d+)|\[(?P<array_task_start>\d+)(?:-(?P<array_task_end>\d+))?\])?$')
+
+
+def stream_lines(args:List[str], cwd:Optional[str] = None) -> Iterator[str]:
+	"""Like subprocess.check_output(args).decode().splitlines(), but yields
+	the lines while the command is still producing them. Stopping early
+	terminates the command."""
+	proc = subprocess.Popen(args, stdout=subprocess.PIPE, encoding='utf-8', cwd=cwd)
+	completed = False
+	try:
+		for line in none_throws(proc.stdout):
+			yield line.rstrip('\n')
+		completed = True
+	finally:
+		none_throws(proc.stdout).close()
+		if not completed:
+			proc.terminate()
+		returncode = proc.wait()
+	if returncode:
+		raise subprocess.CalledProcessError(returncode, args)
+
+
 class Slurm:
 	accounts: Set[str]
 
-	def __init__(self, accounts:Iterable[str]):
+	def __init__(self, accounts:Iterable[str], path:str = '.', cluster:Optional[str] = None):
 		self.accounts = set(accounts)
+		self.path = path # cirrus-scripts checkout with the .schedule-log
+		self.cluster = cluster # for Slurm's --clusters, if it isn't the local one
+		self.schedule_log_offset = 0
+
+	def command(self, name:str, *args:str) -> List[str]:
+		return [name, *(['--clusters', self.cluster] if self.cluster else []), *args]
 
-	def scheduled_jobs(self, since=None):
+	def scheduled_jobs(self, since=None, offset=0):
+		"""Jobs in the .schedule-log submitted since `since`, starting at byte
+		`offset` in the log. Afterwards, `schedule_log_offset` is where the
+		next call can continue reading."""
 		if since is None:
 			since = datetime(1970, 1, 1)
 
 		since_timestamp = since.strftime('%Y%m%d%H%M%S')
 		
-		with open('.schedule-log') as fh:
+		with open(os.path.join(self.path, '.schedule-log'), 'rb') as fh:
+			if offset > os.fstat(fh.fileno()).st_size:
+				offset = 0 # log was truncated, start over
+			fh.seek(offset)
 			lines = fh.readlines()
+		# Don't read a line that is still being written, next time.
+		if lines and not lines[-1].endswith(b'\n'):
+			lines.pop()
+		self.schedule_log_offset = offset + sum(len(line) for line in lines)
 		for line in lines:
-			timestamp, line_job_id, arguments = line.rstrip().split(' ', maxsplit=2)
+			timestamp, line_job_id, arguments = line.decode().rstrip().split(' ', maxsplit=2)
 			if not line_job_id.isnumeric():
 				continue
 			if timestamp.isnumeric() and timestamp >= since_timestamp:
 				yield from self.jobs_from_cli_args({'JobId': line_job_id, 'SubmitTime': timestamp, 'State': 'PENDING'}, arguments.split(' '))
 
 	def current_jobs(self, additional_args:List[str]=[]):
-		output = subprocess.check_output(['squeue',
+		lines = stream_lines(self.command('squeue',
 			'--account', ','.join(self.accounts),
 			'--format', '%i|%K|%F|%C|%b|%j|%P|%r|%u|%y|%T|%M|%b|%N',
-			*additional_args])
-		lines = output.decode().splitlines()
+			*additional_args), cwd=self.path)
 		mapping = {
 			'JOBID': 'JobId',
 			'NAME': 'JobName',
@@ -107,8 +156,11 @@ class Slurm:
 			'TIME': 'Elapsed',
 			'REASON': 'Reason',
 		}
-		headers = [mapping.get(header, header) for header in lines[0].strip().split('|')]
-		for line in lines[1:]:
+		header_line = next(lines, None)
+		if header_line is None:
+			return
+		headers = [mapping.get(header, header) for header in header_line.strip().split('|')]
+		for line in lines:
 			job = dict(zip(headers, line.strip().split('|')))
 
 			if job['ArrayTaskId'] == 'N/A':
@@ -120,22 +172,24 @@ class Slurm:
 				raise ValueError('Job interpretation error: {!r}'.format(job))
 
 	def accounting_jobs(self, additional_args:List[str]=[]):
-		output = subprocess.check_output(['sacct',
+		lines = stream_lines(self.command('sacct',
 			'--parsable2',
 			'--accounts', ','.join(self.accounts),
 			'--format', 'ALL',
 			*additional_args
-		])
-		lines = output.decode().splitlines()
+		), cwd=self.path)
 		mapping = {
 			'JobIDRaw': 'JobIDRaw',
 			'JobState': 'State',
 			'JobID': 'JobId'
 		}
-		headers = [mapping.get(header, header) for header in lines[0].strip().split('|')]
-		for line in lines[1:]:
+		header_line = next(lines, None)
+		if header_line is None:
+			return
+		headers = [mapping.get(header, header) for header in header_line.strip().split('|')]
+		for line in lines:
 			job = dict(zip(headers, line.strip().split('|')))
-			match = re.match(r'^(?P<array_job_id>\d+)(?:_(?P<array_task_id>\d+)|\[(?P<array_task_start>\d+)(?:-(?P<array_task_end>\d+))?\])?$', job['JobId'])
+			match = SACCT_JOB_ID.match(job['JobId'])
 
 			# job with suffix, like \d_\d.batch or .extern
 			if not match:
@@ -190,7 +244,7 @@ class Slurm:
 		else:
 			job_pattern = {'JobId': job_id}
 
-		with open('.schedule-log') as fh:
+		with open(os.path.join(self.path, '.schedule-log')) as fh:
 			for line in fh:
 				timestamp, line_job_id, arguments = line.rstrip().split(' ', maxsplit=2)
 				if not line_job_id.isnumeric():
@@ -204,7 +258,7 @@ class Slurm:
 		return None
 
 	def current_job(self, job_id):
-		output = subprocess.check_output(['scontrol', '--details', 'show', 'job', job_id])
+		output = subprocess.check_output(self.command('scontrol', '--details', 'show', 'job', job_id), cwd=self.path)
 		job = dict()
 		for line in output.decode().splitlines():
 			for match in re.finditer(r'\b(?P<key>[A-Z][A-Za-z_\/:]+)=(?P<value>[^\s]+)', line):
@@ -219,6 +273,18 @@ class Slurm:
 			'JobId': '{}_{}'.format(job['ArrayJobId'], job['ArrayTaskId']) if 'ArrayJobId' in job else job['JobId']
 		})
 
+	def accounting_jobs_between(self, start:datetime, end:datetime, names:Iterable[str], states:Iterable[str]):
+		"""Jobs with one of these names that were in one of these states
+		between start and end. For states a job ends in, that means it ended
+		in that window. Names have to be exact: sacct --name doesn't match
+		patterns."""
+		return self.accounting_jobs([
+			'--starttime', start.strftime('%Y-%m-%dT%H:%M:%S'),
+			'--endtime', end.strftime('%Y-%m-%dT%H:%M:%S'),
+			'--state', ','.join(states),
+			'--name', ','.join(sorted(names))
+		])
+
 	def accounting_job(self, job_id):
 		return next(iter(self.accounting_jobs(['--job', job_id])), None)
 
@@ -310,10 +376,10 @@ class Slurm:
 				})
 
 
-def read_collections():
+def read_collections(path='.'):
 	output = subprocess.check_output(['bash',
 		'--init-file', 'env/init.sh',
-		'-c', 'source config.sh; for k in "${!COLLECTIONS[@]}"; do printf "%s\t%s\n" $k ${COLLECTIONS[$k]}; done'])
+		'-c', 'source config.sh; for k in "${!COLLECTIONS[@]}"; do printf "%s\t%s\n" $k ${COLLECTIONS[$k]}; done'], cwd=path)
 	lines = output.decode().splitlines()
 	collections = {}
 
@@ -335,35 +401,132 @@ def read_collections():
 	return collections
 
 
-def read_config_var(varname):
+def read_config_var(varname, path='.'):
 	output = subprocess.check_output(['bash',
 		'--init-file', 'env/init.sh',
-		'-c', 'source config.sh; echo ${{{}}}'.format(varname)])
+		'-c', 'source config.sh; echo ${{{}}}'.format(varname)], cwd=path)
 	return output.decode().strip()
 
 
-def read_accounts():
+def read_accounts(path='.'):
 	"""Get Slurm account names from environment or cirrus-scripts config"""
-	return os.getenv('SBATCH_ACCOUNT', read_config_var('SBATCH_ACCOUNT')).split(',')
+	return os.getenv('SBATCH_ACCOUNT', read_config_var('SBATCH_ACCOUNT', path)).split(',')
 
 
-slurm = Slurm(read_accounts())
-
 app = Application()
 
+def job_state(job:Job) -> Optional[str]:
+	"""State of a job, without the "by <uid>" sacct adds to CANCELLED."""
+	return job['State'].split(' ', maxsplit=1)[0] if 'State' in job else None
+
+
+RollupKey = Tuple[Optional[str],Optional[str],Optional[str],Optional[str],Optional[str]]
+
+
+def rollup_key(job:Job) -> RollupKey:
+	# Per job array (or job, if it is not part of one), like the progress
+	# bars in the dashboard's grid.
+	return job.collection, job.language, job.step, job.get('ArrayJobId') or job.get('JobId'), job_state(job)
+
+
+def job_resources(job:Job) -> Dict[str,int]:
+	"""What a job adds to its rollup: itself, whether it is held, and the
+	CPUs and GPUs allocated to it."""
+	cpus = job.get('AllocCPUS', '')
+	gpus = re.search(r'gpu:(\d+)', job.get('AllocGRES', '')) or re.search(r'gres/gpu=(\d+)', job.get('AllocTRES', ''))
+	return {
+		'jobs': 1,
+		'held': 1 if job.get('Reason') == 'JobHeldUser' else 0,
+		'cpus': int(cpus) if cpus.isdigit() else 0,
+		'gpus': int(gpus[1]) if gpus else 0,
+	}
+
+
 class JobList:
 	jobs: Dict[str,Tuple[Job,datetime]]
+	indexes: Dict[str,Dict[Any,Set[str]]]
+	rollups: Dict[RollupKey,Dict[str,int]]
+
+	# Job properties we can look up jobs by, see find()
+	INDEXES: Dict[str,Callable[[Job],Any]] = {
+		'state': job_state,
+		'step': lambda job: job.step,
+		'language': lambda job: job.language,
+		'collection': lambda job: job.collection,
+		'array': lambda job: job.get('ArrayJobId'),
+	}
 
 	def __init__(self, jobs:Iterable[Tuple[Job, datetime]] = []):
-		self.jobs = {job['JobId']: (job, timestamp) for job, timestamp in jobs}
+		self.jobs = {}
+		self.indexes = {name: {} for name in self.INDEXES}
+		self.rollups = {}
+		for job, timestamp in jobs:
+			self._put(job, timestamp)
+
+	def _put(self, job:Job, timestamp:datetime) -> None:
+		"""Stores job, and keeps the indexes and rollups in sync."""
+		job_id = job['JobId']
+		previous = self.jobs[job_id][0] if job_id in self.jobs else None
+		self.jobs[job_id] = (job, timestamp)
+		if previous is not None:
+			self._rollup(previous, -1)
+		self._rollup(job, 1)
+		for name, key in self.INDEXES.items():
+			index = self.indexes[name]
+			value = key(job)
+			if previous is not None:
+				previous_value = key(previous)
+				if previous_value == value:
+					continue
+				index[previous_value].discard(job_id)
+				if not index[previous_value]:
+					del index[previous_value]
+			index.setdefault(value, set()).add(job_id)
+
+	def _rollup(self, job:Job, sign:int) -> None:
+		key = rollup_key(job)
+		rollup = self.rollups.setdefault(key, {'jobs': 0, 'held': 0, 'cpus': 0, 'gpus': 0})
+		for name, value in job_resources(job).items():
+			rollup[name] += sign * value
+		if not rollup['jobs']:
+			del self.rollups[key]
+
+	def remove(self, job_id:str) -> None:
+		job, _ = self.jobs.pop(job_id)
+		self._rollup(job, -1)
+		for name, key in self.INDEXES.items():
+			value = key(job)
+			self.indexes[name][value].discard(job_id)
+			if not self.indexes[name][value]:
+				del self.indexes[name][value]
+
+	def matches(self, job:Job, **criteria:Iterable[Any]) -> bool:
+		"""Whether a job, which doesn't have to be in this list, matches the
+		criteria as find() interprets them."""
+		return all(self.INDEXES[name](job) in values for name, values in criteria.items())
+
+	def find(self, **criteria:Iterable[Any]) -> Set[str]:
+		"""Ids of jobs that match all criteria. Each is one of the INDEXES
+		with the values it may have, e.g. find(state=['PENDING', 'RUNNING'])."""
+		if not criteria:
+			return set(self.jobs)
+		matches = []
+		for name, values in criteria.items():
+			values = list(values)
+			if len(values) == 1:
+				matches.append(self.indexes[name].get(values[0], set()))
+			else:
+				matches.append(set().union(*(self.indexes[name].get(value, ()) for value in values)))
+		matches.sort(key=len)
+		return matches[0].intersection(*matches[1:])
 
 	def insert(self, jobs:Iterable[Job], timestamp:datetime) -> None:
 		for job in jobs:
 			if job['JobId'] in self.jobs:
 				current = self.jobs[job['JobId']][0]
-				self.jobs[job['JobId']] = (Job({**current, **job}), timestamp)
+				self._put(Job({**current, **job}), timestamp)
 			else:
-				self.jobs[job['JobId']] = (job, timestamp)
+				self._put(job, timestamp)
 
 	def update(self, joblist:'JobList') -> None:
 		for job, update_timestamp in joblist.with_timestamp():
@@ -371,12 +534,12 @@ class JobList:
 				current, current_timestamp = self.jobs[job['JobId']]
 				# If the entry is newer, prioritise its values
 				if update_timestamp >= current_timestamp:
-					self.jobs[job['JobId']] = (type(current)({**current, **job}), update_timestamp)
+					self._put(type(current)({**current, **job}), update_timestamp)
 				# if it is older, but has more info, add the info but don't overwrite anything
-				elif set(job.items()) - set(current.items()):
-					self.jobs[job['JobId']] = (type(current)({**job, **current}), current_timestamp)
+				elif not job.keys() <= current.keys():
+					self._put(type(current)({**job, **current}), current_timestamp)
 			else:
-				self.jobs[job['JobId']] = (job, update_timestamp)
+				self._put(job, update_timestamp)
 
 	def __iter__(self) -> Iterator[Job]:
 		return iter(job for job, _ in self.jobs.values())
@@ -387,6 +550,9 @@ class JobList:
 	def filter(self, op:Callable[[Job],bool]) -> 'JobList':
 		return self.__class__(entry for entry in self.jobs.values() if op(entry[0]))
 
+	def select(self, job_ids:Iterable[str]) -> 'JobList':
+		return self.__class__(self.jobs[job_id] for job_id in job_ids if job_id in self.jobs)
+
 	def get(self, job_id:str, default:T=None) -> Union[Job,T]:
 		return self.jobs[job_id][0] if job_id in self.jobs else default
 
@@ -394,6 +560,242 @@ class JobList:
 		return self.jobs.keys()
 
 
+def submitted_at(job:Job) -> Optional[datetime]:
+	"""When a job was submitted according to the .schedule-log, or else sacct.
+	Both State.load and State.evict go by this, so that a job is either
+	loaded or archived."""
+	try:
+		return datetime.strptime(job['SubmitTime'], '%Y%m%d%H%M%S') # .schedule-log
+	except (KeyError, ValueError):
+		pass
+	try:
+		return datetime.fromisoformat(job['Submit']) # sacct prints 2024-01-31T12:00:00
+	except (KeyError, ValueError):
+		return None
+
+
+class Archive:
+	"""Append-only store for jobs evicted from State. One gzipped json-lines
+	file per month in which the jobs were submitted, that is only read when
+	someone asks for old jobs. Next to each is a plain list of the job ids in
+	it, so looking up a job only decompresses the file that has it."""
+	def __init__(self, path:str):
+		self.path = path
+		# Job ids per file, with the size and mtime of the file they're for
+		self.ids_cache: Dict[str,Tuple[Tuple[int,int],Set[str]]] = {}
+
+	def segments(self, since:Optional[datetime] = None) -> List[str]:
+		"""Archive files, newest first, that may contain jobs submitted after since."""
+		paths = sorted(glob(os.path.join(self.path, 'jobs-*.jsonl.gz')), reverse=True)
+		if since is not None:
+			first = 'jobs-{:%Y-%m}.jsonl.gz'.format(since)
+			paths = [path for path in paths if os.path.basename(path) >= first]
+		return paths
+
+	def append(self, entries:Iterable[Tuple[Job,datetime]]) -> None:
+		"""Adds jobs to the archive, except the ones that are in it already."""
+		by_month: Dict[str,List[str]] = {}
+		for job, timestamp in entries:
+			month = '{:%Y-%m}'.format(submitted_at(job) or timestamp)
+			by_month.setdefault(month, []).append((job['JobId'], json.dumps({'timestamp': timestamp.isoformat(), 'job': job}) + '\n'))
+		os.makedirs(self.path, exist_ok=True)
+		for month, entries in by_month.items():
+			path = os.path.join(self.path, 'jobs-{}.jsonl.gz'.format(month))
+			if os.path.exists(path):
+				archived = self.ids(path)
+				entries = [(job_id, line) for job_id, line in entries if job_id not in archived]
+				if not entries:
+					continue
+			# Every append adds a gzip member, which gzip reads as one stream.
+			with gzip.open(path, 'at', compresslevel=6, encoding='utf-8') as fh:
+				fh.writelines(line for _, line in entries)
+			with open(self._ids_path(path), 'a') as fh:
+				fh.writelines(job_id + '\n' for job_id, _ in entries)
+
+	def horizon(self) -> Optional[datetime]:
+		"""Jobs submitted before this are in the archive, unless they were
+		still pending or running. None if nothing was archived yet."""
+		try:
+			with open(os.path.join(self.path, 'horizon')) as fh:
+				return datetime.fromisoformat(fh.read().strip())
+		except (OSError, ValueError):
+			return None
+
+	def set_horizon(self, horizon:datetime) -> None:
+		os.makedirs(self.path, exist_ok=True)
+		with open(os.path.join(self.path, 'horizon.tmp'), 'w') as fh:
+			fh.write(horizon.isoformat() + '\n')
+		os.replace(os.path.join(self.path, 'horizon.tmp'), os.path.join(self.path, 'horizon'))
+
+	def _ids_path(self, path:str) -> str:
+		return path[:-len('.jsonl.gz')] + '.ids'
+
+	def ids(self, path:str) -> Set[str]:
+		"""Ids of the jobs in archive file path. Made from the file itself if
+		there is no list of them yet."""
+		stat = os.stat(path)
+		key = (stat.st_size, stat.st_mtime_ns)
+		cached = self.ids_cache.get(path)
+		if cached is not None and cached[0] == key:
+			return cached[1]
+
+		try:
+			with open(self._ids_path(path)) as fh:
+				ids = set(fh.read().split())
+		except FileNotFoundError:
+			ids = {job['JobId'] for job, _ in self.read(path)}
+			try:
+				with open(self._ids_path(path) + '.tmp', 'w') as fh:
+					fh.writelines(job_id + '\n' for job_id in ids)
+				os.replace(self._ids_path(path) + '.tmp', self._ids_path(path))
+			except OSError as e:
+				print('Could not write job ids of {}: {}'.format(path, e), file=sys.stderr)
+
+		self.ids_cache[path] = key, ids
+		return ids
+
+	def read(self, path:str, job_id:Optional[str] = None) -> Iterator[Tuple[Job,datetime]]:
+		needle = json.dumps(job_id) if job_id is not None else ''
+		with gzip.open(path, 'rt', encoding='utf-8') as fh:
+			for line in fh:
+				if needle not in line: # don't parse lines that can't be it
+					continue
+				entry = json.loads(line)
+				if job_id is None or entry['job']['JobId'] == job_id:
+					yield Job(entry['job']), datetime.fromisoformat(entry['timestamp'])
+
+	def jobs(self, since:Optional[datetime] = None) -> Iterator[Tuple[Job,datetime]]:
+		for path in self.segments(since):
+			yield from self.read(path)
+
+	def get(self, job_id:str) -> Optional[Job]:
+		for path in self.segments():
+			if job_id not in self.ids(path):
+				continue
+			for job, _ in self.read(path, job_id):
+				return job
+		return None
+
+
+# Number of threads that walk the shard directories for DiskUsage
+DISK_USAGE_WORKERS = int(os.getenv('DISK_USAGE_WORKERS', '16'))
+
+
+class DiskUsage:
+	"""Bytes and number of files under directory trees. Remembers per
+	directory the size and number of files directly in it, and only lists it
+	again when its mtime changes. Files that are rewritten in place without
+	their directory changing are not noticed until it does. What it
+	remembers is kept in a json file so it survives restarts."""
+	def __init__(self, path:str):
+		self.path = path
+		# Directory -> (mtime, bytes, files, subdirectories)
+		self.entries: Optional[Dict[str,Tuple[int,int,int,List[str]]]] = None
+		self.lock = threading.Lock()
+
+	def load(self) -> Dict[str,Tuple[int,int,int,List[str]]]:
+		try:
+			with gzip.open(self.path, 'rt', encoding='utf-8') as fh:
+				return {path: tuple(entry) for path, entry in json.load(fh).items()}
+		except (OSError, ValueError):
+			return {}
+
+	def save(self) -> None:
+		# Write to a temporary file first so a crash leaves the old one intact.
+		# Not being able to write it (e.g. a read-only checkout) only means
+		# the next restart scans everything again.
+		try:
+			with gzip.open(self.path + '.tmp', 'wt', compresslevel=6, encoding='utf-8') as fh:
+				json.dump(self.entries, fh)
+			os.replace(self.path + '.tmp', self.path)
+		except OSError as e:
+			print('Could not write disk usage to {}: {}'.format(self.path, e), file=sys.stderr)
+
+	def scan_directory(self, path:str) -> Tuple[int,int,int,List[str]]:
+		try:
+			mtime = os.stat(path).st_mtime_ns
+		except OSError:
+			return 0, 0, 0, []
+		cached = none_throws(self.entries).get(path)
+		if cached is not None and cached[0] == mtime:
+			return cached
+		size, files, subdirs = 0, 0, []
+		try:
+			with os.scandir(path) as it:
+				for entry in it:
+					try:
+						if entry.is_dir(follow_symlinks=False):
+							subdirs.append(entry.path)
+						elif entry.is_file(follow_symlinks=False):
+							size += entry.stat(follow_symlinks=False).st_size
+							files += 1
+					except OSError: # removed while we were looking
+						pass
+		except OSError:
+			return 0, 0, 0, []
+		return mtime, size, files, subdirs
+
+	def scan(self, roots:Dict[T,str]) -> Dict[T,Tuple[int,int]]:
+		"""Bytes and number of files under each of the root directories.
+		Directories are scanned one level at a time, in parallel."""
+		with self.lock:
+			if self.entries is None:
+				self.entries = self.load()
+			entries: Dict[str,Tuple[int,int,int,List[str]]] = {}
+			totals = {key: (0, 0) for key in roots}
+			level = list(roots.items())
+			with ThreadPoolExecutor(max_workers=DISK_USAGE_WORKERS) as executor:
+				while level:
+					next_level = []
+					for (key, path), entry in zip(level, executor.map(self.scan_directory, (path for _, path in level))):
+						entries[path] = entry
+						totals[key] = (totals[key][0] + entry[1], totals[key][1] + entry[2])
+						next_level.extend((key, subdir) for subdir in entry[3])
+					level = next_level
+			# Directories under the roots we scanned that we didn't see now are
+			# removed, forget those. Keep what we know about other roots.
+			scanned = set(roots.values())
+			prefixes = tuple(os.path.join(path, '') for path in scanned)
+			merged = {
+				path: entry
+				for path, entry in self.entries.items()
+				if path not in scanned and not path.startswith(prefixes)
+			}
+			merged.update(entries)
+			if merged != self.entries:
+				self.entries = merged
+				self.save()
+			return totals
+
+
+# Jobs that are done and were submitted longer ago than this are moved from
+# memory to the archive. Jobs that are still pending or running stay.
+RETENTION = timedelta(days=int(os.getenv('RETENTION_DAYS', '365')))
+
+# How often State.update looks for jobs to move to the archive
+EVICTION_INTERVAL = timedelta(hours=1)
+
+# How State.update asks sacct about active jobs: 'ids' asks for each by its
+# id, 'window' asks which jobs ended since the last update, and only asks by
+# id about the jobs it didn't hear about that way.
+POLL_MODE = os.getenv('POLL_MODE', 'ids')
+
+# States that jobs end in, for sacct --state. Jobs that are pending or running
+# are in squeue.
+WINDOW_STATES = ['BF', 'CA', 'CD', 'DL', 'F', 'NF', 'OOM', 'PR', 'TO']
+
+# How far window polling looks back before the last update, for accounting
+# that lags behind a bit.
+WINDOW_OVERLAP = timedelta(minutes=1)
+
+# How long State.get_job may reuse the details of a job that is not done
+DETAIL_TTL = timedelta(seconds=10)
+
+# How many jobs State.get_job keeps the details of, the least recently asked
+# for are dropped first
+DETAIL_CACHE_SIZE = int(os.getenv('DETAIL_CACHE_SIZE', '1000'))
+
+
 def add_jobs_to_set(job_id_set, jobs):
 	for job in jobs:
 		job_id_set.add(job['JobId'])
@@ -408,27 +810,80 @@ class State:
 		'TIMEOUT'
 	}
 
-	def __init__(self, since):
-		self.last_update = datetime.now()
-		self.jobs = JobList((job, self.last_update) for job in slurm.jobs(since=since, include_completed=True))
+	def __init__(self, slurm:Slurm, archive:Archive):
+		self.slurm = slurm
+		self.archive = archive
+		self.last_update = datetime.min
+		self.last_eviction = datetime.min
+		self.details: 'OrderedDict[str,Tuple[Job,Optional[datetime]]]' = OrderedDict()
+		self.jobs = JobList()
+		self.loaded = False
+
+		# Held while changing jobs, and by request handlers while they go
+		# over them. Only the poller changes them, so it doesn't need the lock
+		# to read them.
+		self.lock = threading.RLock()
+
+	def load(self, since):
+		"""Loads the jobs submitted since then. Also the ones from before that
+		weren't archived yet, e.g. because they went past it while the
+		dashboard wasn't running, to move them to the archive now."""
+		now = datetime.now()
+		horizon = self.archive.horizon()
+		start = min(since, horizon) if horizon is not None else since
+		jobs = JobList((job, now) for job in self.slurm.jobs(since=start, include_completed=True))
+		with self.lock:
+			self.jobs = jobs
+			self.last_update = now
+			self.loaded = True
+		if start < since:
+			self.evict(since)
+			self.last_eviction = now
 
 	def update(self):
 		now = datetime.now()
 
 		# Active jobs (that we need updates on)
-		active_jobs = self.jobs.filter(lambda job: 'State' not in job or job['State'] not in self.STALE_STATES)
+		active_jobs = self.jobs.select(self.active_job_ids())
 
 		# List of seen job ids in this update. Any job in active_jobs that's not also in seen_jobs is not active.
 		seen_jobs = set()
 
 		# Add any new scheduled jobs
-		active_jobs.insert(add_jobs_to_set(seen_jobs, slurm.scheduled_jobs(since=self.last_update)), now)
+		active_jobs.insert(add_jobs_to_set(seen_jobs, self.slurm.scheduled_jobs(since=self.last_update, offset=self.slurm.schedule_log_offset)), now)
+
+		if POLL_MODE == 'window':
+			# Pending and running jobs from the queue of our accounts, without
+			# listing every active job id, but only take the jobs we are
+			# keeping track of.
+			active_jobs.insert(add_jobs_to_set(seen_jobs, (
+				job for job in self.slurm.current_jobs()
+				if job['JobId'] in active_jobs.jobs
+			)), now)
+
+			# Ask sacct which jobs with these names ended since the last update,
+			# and only apply those whose state we didn't know yet.
+			names = {job['JobName'] for job in active_jobs if 'JobName' in job}
+			if names:
+				active_jobs.insert((
+					job for job in add_jobs_to_set(seen_jobs, (
+						job for job in self.slurm.accounting_jobs_between(self.last_update - WINDOW_OVERLAP, now, names, WINDOW_STATES)
+						if job['JobId'] in active_jobs.jobs
+					))
+					if job_state(job) != job_state(active_jobs.jobs[job['JobId']][0])
+				), now)
+		else:
+			# Query latest status on these jobs
+			active_jobs.insert(add_jobs_to_set(seen_jobs, self.slurm.accounting_jobs(['--jobs', ','.join(active_jobs.job_ids())])), now)
 
-		# Query latest status on these jobs
-		active_jobs.insert(add_jobs_to_set(seen_jobs, slurm.accounting_jobs(['--jobs', ','.join(active_jobs.job_ids())])), now)
+			# Query active jobs, but still limit to only jobs that appeared in our scheduling log.
+			active_jobs.insert(add_jobs_to_set(seen_jobs, self.slurm.current_jobs(['--jobs', ','.join(active_jobs.job_ids())])), now)
 
-		# Query active jobs, but still limit to only jobs that appeared in our scheduling log.
-		active_jobs.insert(add_jobs_to_set(seen_jobs, slurm.current_jobs(['--jobs', ','.join(active_jobs.job_ids())])), now)
+		# Jobs that the window missed, ask sacct about them by id
+		if POLL_MODE == 'window':
+			missing = [job_id for job_id in active_jobs.job_ids() if job_id not in seen_jobs]
+			if missing:
+				active_jobs.insert(add_jobs_to_set(seen_jobs, self.slurm.accounting_jobs(['--jobs', ','.join(missing)])), now)
 
 		# Remove dead jobs
 		active_jobs.insert([
@@ -437,35 +892,171 @@ class State:
 			if job['JobId'] not in seen_jobs
 		], now)
 
-		self.jobs.update(active_jobs)
+		with self.lock:
+			self.jobs.update(active_jobs)
+			self.last_update = now
 
-		self.last_update = now
+		if now - self.last_eviction > EVICTION_INTERVAL:
+			self.evict(now - RETENTION)
+			self.last_eviction = now
 
 		return active_jobs
 
+	def evict(self, horizon:datetime) -> None:
+		"""Moves jobs that are done and were submitted before horizon to the
+		archive. Those are the jobs load() would skip."""
+		evicted = [
+			self.jobs.jobs[job_id]
+			for job_state in self.STALE_STATES
+			for job_id in self.jobs.indexes['state'].get(job_state, ())
+			if (submitted_at(self.jobs.jobs[job_id][0]) or self.jobs.jobs[job_id][1]) < horizon
+		]
+		self.archive.append(evicted)
+		with self.lock:
+			for job, _ in evicted:
+				self.jobs.remove(job['JobId'])
+				self.details.pop(job['JobId'], None)
+
+		# Next load() starts from the oldest job we didn't archive
+		self.archive.set_horizon(min((
+			submitted
+			for job_id in self.active_job_ids()
+			if (submitted := submitted_at(self.jobs.jobs[job_id][0]) or self.jobs.jobs[job_id][1]) < horizon
+		), default=horizon))
+
+	def active_job_ids(self) -> Iterator[str]:
+		"""Ids of jobs that aren't in one of the STALE_STATES, from the index
+		so we don't have to look at the whole history."""
+		for job_state, job_ids in self.jobs.indexes['state'].items():
+			if job_state not in self.STALE_STATES:
+				yield from job_ids
+
 	def get_job(self, job_id):
-		job = self.jobs.get(job_id, Job(JobId=job_id))
-		update = slurm.job(job_id)
+		"""Job with all details Slurm has on it. These are cached, for good
+		once the job is done, and for DETAIL_TTL while it is not, but only for
+		the DETAIL_CACHE_SIZE jobs that were asked for last."""
+		now = datetime.now()
+		with self.lock:
+			cached = self.details.get(job_id)
+			if cached is not None and (cached[1] is None or cached[1] > now):
+				self.details.move_to_end(job_id)
+				return cached[0]
+
+		# Merge into a copy, the job in self.jobs is indexed by its state
+		job = Job(self.jobs.get(job_id) or self.archive.get(job_id) or Job(JobId=job_id))
+		update = self.slurm.job(job_id)
 		if update: job.update(update)
+
+		# Log paths in .schedule-log are relative to the cirrus-scripts checkout
+		for key in ['StdOut', 'StdErr']:
+			if job.get(key):
+				job[key] = os.path.join(self.slurm.path, job[key])
+
+		with self.lock:
+			self.details[job_id] = (job, None if job_state(job) in self.STALE_STATES else now + DETAIL_TTL)
+			self.details.move_to_end(job_id)
+			while len(self.details) > DETAIL_CACHE_SIZE:
+				self.details.popitem(last=False)
 		return job
 
 
-state = State(since=datetime.now() - timedelta(days=365))
+class Source:
+	"""A cirrus-scripts checkout, and the jobs it submitted to Slurm. The
+	state of each source is kept up to date by its own poller thread."""
+	def __init__(self, name:str, path:str, cluster:Optional[str] = None):
+		self.name = name
+		self.path = os.path.abspath(path)
+		self.slurm = Slurm(read_accounts(self.path), path=self.path, cluster=cluster)
+		self.state = State(self.slurm, Archive(os.path.join(self.path, '.dashboard-archive')))
+		self.disk_usage = DiskUsage(os.path.join(self.path, '.dashboard-disk-usage.json.gz'))
+		self.thread: Optional[threading.Thread] = None
+
+	def collections(self) -> Dict[str,Collection]:
+		return read_collections(self.path)
+
+	def start(self, interval:float) -> None:
+		self.thread = threading.Thread(target=self.poll, args=(interval,), name='poller-{}'.format(self.name), daemon=True)
+		self.thread.start()
+
+	def poll(self, interval:float) -> None:
+		while True:
+			try:
+				if not self.state.loaded:
+					self.state.load(since=datetime.now() - RETENTION)
+				else:
+					self.state.update()
+			except Exception:
+				print('Error while polling {}:'.format(self.name), file=sys.stderr)
+				traceback.print_exc()
+			time.sleep(interval)
+
+
+def read_sources() -> Dict[str,Source]:
+	"""Sources from the SOURCES environment variable, e.g.
+	SOURCES=lumi=/scratch/cirrus-scripts,csd3=/mnt/csd3/cirrus-scripts@csd3
+	where @csd3 is the Slurm cluster, if it is not the local one. Without it,
+	the only source is the cirrus-scripts checkout in the working directory."""
+	selection = os.getenv('SOURCES')
+	if not selection:
+		return {'default': Source('default', '.')}
+	sources = {}
+	for entry in selection.split(','):
+		name, spec = entry.split('=', maxsplit=1)
+		path, _, cluster = spec.partition('@')
+		sources[name] = Source(name, os.path.expanduser(path), cluster or None)
+	return sources
+
+
+sources = read_sources()
+
+# How often the pollers update the state of their source
+POLL_INTERVAL = float(os.getenv('POLL_INTERVAL', '60'))
+
+
+def job_ref(source:Source, job:Job) -> str:
+	"""Id of a job in the API. With more than one source, prefixed with the
+	name of its source."""
+	return source_ref(source, job['JobId'])
+
+
+def source_ref(source:Source, job_id:str) -> str:
+	"""Job (or job array) id, prefixed with the name of its source if there
+	is more than one, as the same id can be used on two clusters."""
+	if len(sources) > 1:
+		return '{}:{}'.format(source.name, job_id)
+	return job_id
+
+
+def still_loading(selection:List[Source]) -> Optional[Response]:
+	"""503 if some of the sources haven't finished their first poll, as no
+	jobs yet doesn't mean there are none."""
+	if all(source.state.loaded for source in selection):
+		return None
+	return Response('Still loading jobs, try again in a moment', 503, {'Retry-After': '1'})
 
 
 @app.url_type('job')
 class JobConverter(URLConverter):
 	def to_pattern(self) -> str:
-		return r'\d+(?:_\d+)?'
+		return r'(?:(?:{}):)?\d+(?:_\d+)?'.format('|'.join(re.escape(name) for name in sources))
 
 	def to_python(self, val: str) -> Job:
-		return state.get_job(val)
+		name, _, job_id = val.rpartition(':')
+		source = sources[name] if name else next(iter(sources.values()))
+		job = source.state.get_job(job_id)
+		job.source = source.name
+		return job
 
 	def to_str(self, val: Any) -> str:
+		if isinstance(val, str): # already a job_ref()
+			return val
 		if 'ArrayJobId' in val:
-			return '{:d}_{:d}'.format(int(val['ArrayJobId']), int(val['ArrayTaskId']))
+			job_id = '{:d}_{:d}'.format(int(val['ArrayJobId']), int(val['ArrayTaskId']))
 		else:
-			return '{:d}'.format(int(val['JobId']))
+			job_id = '{:d}'.format(int(val['JobId']))
+		if len(sources) > 1 and val.source:
+			return '{}:{}'.format(val.source, job_id)
+		return job_id
 
 
 @app.route('/')
@@ -481,43 +1072,122 @@ def show_static_file(request, filename):
 	return send_file(path)
 
 
+def selected_sources(request) -> List[Source]:
+	"""Sources selected by ?source=a,b, or all of them."""
+	if request.args.get('source'):
+		names = request.args['source'].split(',')
+		return [sources[name] for name in names if name in sources]
+	return list(sources.values())
+
+
 @app.route('/collections/')
 def list_collections(request):
 	return send_json([
 		{
 			'name': name,
+			'source': source.name,
 			'languages': collection.languages
-		} for name, collection in read_collections().items()
+		}
+		for source in selected_sources(request)
+		for name, collection in source.collections().items()
 	])
 
 
 @app.route('/jobs/')
 @app.route('/jobs/delta/<str:timestamp>', name='list_jobs_delta')
 def list_jobs(request, timestamp=None):
-	collections = read_collections()
-	state.update()
-	if timestamp:
-		since = datetime.fromisoformat(timestamp)
-	else:
-		since = datetime.now() - timedelta(days=365)
-	return send_json({
-		'timestamp': state.last_update.isoformat(),
-		'jobs': [
+	try:
+		if timestamp or 'since' in request.args:
+			since = datetime.fromisoformat(timestamp or request.args['since'])
+		else:
+			since = datetime.now() - RETENTION
+	except ValueError as e:
+		return Response('Invalid timestamp: {}'.format(e), status_code=400)
+
+	# Filters like ?language=de,fr&state=RUNNING, answered from the indexes
+	filters = {
+		name: request.args[name].split(',')
+		for name in JobList.INDEXES
+		if request.args.get(name)
+	}
+
+	selection = selected_sources(request)
+	if response := still_loading(selection):
+		return response
+
+	# The next delta should start from the source that was updated longest ago
+	last_update = min((source.state.last_update for source in selection), default=datetime.now())
+
+	entries = []
+	for source in selection:
+		collections = source.collections()
+		state = source.state
+
+		jobs: Iterable[Tuple[Job,datetime]]
+		with state.lock:
+			if filters:
+				jobs = [state.jobs.jobs[job_id] for job_id in state.jobs.find(**filters)]
+			else:
+				jobs = list(state.jobs.with_timestamp())
+
+		# Asking for jobs from before the retention horizon? Those are archived.
+		# For them, since is compared to when they were submitted.
+		if since < datetime.now() - RETENTION:
+			jobs = chain(jobs, (
+				(job, (submitted_at(job) or job_timestamp))
+				for job, job_timestamp in state.archive.jobs(since)
+				if job['JobId'] not in state.jobs.jobs and state.jobs.matches(job, **filters)
+			))
+
+		entries.extend(
 			{
-				'id': job['JobId'],
+				'id': job_ref(source, job),
+				'source': source.name,
 				'step': job.step,
 				'language': job.language,
 				'collection': job.collection,
 				'slurm': job, # the dict data
-				'stdout': app.url_for('show_stream', job=job, stream='stdout'),
-				'stderr': app.url_for('show_stream', job=job, stream='stderr'),
-				'link': app.url_for('show_job', job=job),
+				'stdout': app.url_for('show_stream', job=job_ref(source, job), stream='stdout'),
+				'stderr': app.url_for('show_stream', job=job_ref(source, job), stream='stderr'),
+				'link': app.url_for('show_job', job=job_ref(source, job)),
 				'last_update': job_timestamp.isoformat()
 			}
-			for job, job_timestamp in state.jobs.with_timestamp()
+			for job, job_timestamp in jobs
 			if job_timestamp > since \
-			and job.collection is None or job.collection in collections
-		]
+			and (job.collection is None or job.collection in collections)
+		)
+
+	return send_json({
+		'timestamp': last_update.isoformat(),
+		'jobs': entries
+	})
+
+
+@app.route('/jobs/summary')
+def summarize_jobs(request):
+	selection = selected_sources(request)
+	if response := still_loading(selection):
+		return response
+	rollups = []
+	for source in selection:
+		collections = source.collections()
+		with source.state.lock:
+			rollups.extend(
+				{
+					'source': source.name,
+					'collection': collection,
+					'language': language,
+					'step': step,
+					'array': source_ref(source, array),
+					'state': job_state,
+					**rollup
+				}
+				for (collection, language, step, array, job_state), rollup in source.state.jobs.rollups.items()
+				if collection is None or collection in collections
+			)
+	return send_json({
+		'timestamp': min((source.state.last_update for source in selection), default=datetime.now()).isoformat(),
+		'rollups': rollups
 	})
 
 
@@ -530,7 +1200,8 @@ def tail(filename):
 @app.route('/jobs/<job:job>/')
 def show_job(request, job):
 	return send_json({
-		'id': job['JobId'],
+		'id': JobConverter().to_str(job),
+		'source': job.source,
 		'slurm': job,
 		'stdout': app.url_for('show_stream', job=job, stream='stdout'),
 		'stderr': app.url_for('show_stream', job=job, stream='stderr')
@@ -568,6 +1239,225 @@ def show_stream(request, stream, job):
 	return FileResponse(Tailer(path))
 
 
+# Limits for /jobs/search: how much of the end of each log is searched, how
+# much is searched in total, how many lines per log are returned, and how
+# long a returned line can be.
+SEARCH_FILE_BYTES = 8 * 1024 * 1024
+SEARCH_TOTAL_BYTES = 2 * 1024 * 1024 * 1024
+SEARCH_FILE_MATCHES = 20
+SEARCH_LINE_LENGTH = 1024
+
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', '8'))
+
+
+def search_file(path:str, needle:bytes) -> Tuple[int, List[Tuple[int,str]]]:
+	"""Searches the last SEARCH_FILE_BYTES of a file for needle. Returns the
+	number of bytes searched, and the offset and text of matching lines."""
+	matches: List[Tuple[int,str]] = []
+	try:
+		fh = open(path, 'rb')
+	except OSError:
+		return 0, matches
+	with fh:
+		size = os.fstat(fh.fileno()).st_size
+		if size == 0:
+			return 0, matches
+		start = max(0, size - SEARCH_FILE_BYTES)
+		offset = start - start % mmap.ALLOCATIONGRANULARITY # mmap wants aligned offsets
+		with mmap.mmap(fh.fileno(), size - offset, access=mmap.ACCESS_READ, offset=offset) as buf:
+			begin = pos = start - offset
+			while len(matches) < SEARCH_FILE_MATCHES:
+				hit = buf.find(needle, pos)
+				if hit < 0:
+					break
+				lower = max(begin, hit - SEARCH_LINE_LENGTH)
+				line_start = buf.rfind(b'\n', lower, hit) + 1 or lower
+				line_end = buf.find(b'\n', hit, hit + SEARCH_LINE_LENGTH)
+				if line_end < 0:
+					line_end = min(len(buf), hit + SEARCH_LINE_LENGTH)
+				matches.append((offset + line_start, buf[line_start:line_end].decode('utf-8', 'replace')))
+				pos = line_end + 1
+	return size - start, matches
+
+
+def search_logs(logs:Iterable[Tuple[str,str,str]], needle:bytes) -> Iterator[str]:
+	"""Searches (job id, stream, path) logs on a pool of threads, and yields
+	json lines with matches as they are found, and a summary at the end.
+	Files are answered in the order their search finishes, so one large file
+	doesn't hold up the rest."""
+	scanned_files, scanned_bytes = 0, 0
+	pending: Dict[Future,Tuple[str,str,str]] = {}
+	it = iter(logs)
+	log = next(it, None)
+	executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+	try:
+		while True:
+			# Keep a few files per worker in flight, but only start on a file
+			# if we could read all of it, and all that's in flight, within
+			# SEARCH_TOTAL_BYTES.
+			while log is not None and len(pending) < 2 * SEARCH_WORKERS \
+				and scanned_bytes + (len(pending) + 1) * SEARCH_FILE_BYTES <= SEARCH_TOTAL_BYTES:
+				pending[executor.submit(search_file, log[2], needle)] = log
+				log = next(it, None)
+
+			if not pending:
+				break
+
+			done, _ = wait(pending, return_when=FIRST_COMPLETED)
+			for future in done:
+				job_id, stream, path = pending.pop(future)
+				size, matches = future.result()
+				scanned_files += 1
+				scanned_bytes += size
+				for offset, line in matches:
+					yield json.dumps({'id': job_id, 'stream': stream, 'offset': offset, 'line': line}) + '\n'
+
+		yield json.dumps({'scanned_files': scanned_files, 'scanned_bytes': scanned_bytes, 'truncated': log is not None}) + '\n'
+	finally:
+		for future in pending:
+			future.cancel()
+		executor.shutdown(wait=False)
+
+
+@app.route('/jobs/search')
+def search_jobs(request):
+	"""Searches the logs of jobs, selected with the same filters as /jobs/,
+	for the string q. Answers with json lines as matches are found."""
+	if not request.args.get('q'):
+		return Response('Missing search string q', status_code=400)
+
+	filters = {
+		name: request.args[name].split(',')
+		for name in JobList.INDEXES
+		if request.args.get(name)
+	}
+	streams = request.args.get('stream', 'stdout,stderr').split(',')
+	mapping = {
+		'stdout': 'StdOut',
+		'stderr': 'StdErr'
+	}
+
+	logs = []
+	for source in selected_sources(request):
+		with source.state.lock:
+			jobs = [source.state.jobs.get(job_id) for job_id in source.state.jobs.find(**filters)]
+		logs.extend(
+			(job_ref(source, job), stream, os.path.join(source.slurm.path, job[mapping[stream]]))
+			for job in jobs
+			for stream in streams
+			if stream in mapping and job.get(mapping[stream])
+		)
+
+	return StreamResponse(search_logs(logs, request.args['q'].encode()), headers={'Content-Type': 'application/x-ndjson'}, buffer_size=1)
+
+
+# Job states that count as failures for /failures/
+FAILURE_STATES = ['FAILED', 'TIMEOUT', 'OUT_OF_MEMORY', 'NODE_FAIL']
+
+# How much of the end of StdErr is read to find what went wrong
+SIGNATURE_TAIL_BYTES = 16 * 1024
+
+SIGNATURE_ERROR = re.compile(r'error|exception|traceback|killed|abort|fault|cancelled|denied', re.IGNORECASE)
+
+# Bits of a line that differ between jobs that fail the same way
+SIGNATURE_NORMALIZATIONS = [
+	(re.compile(r'[\w.~+-]*(?:/[\w.+-]+)+/?'), '<path>'),
+	(re.compile(r'\b0x[0-9a-fA-F]+\b'), '<hex>'),
+	(re.compile(r'\d+(?:[.:]\d+)*'), '<n>'),
+	(re.compile(r'\s+'), ' '),
+]
+
+# How many logs' signatures are remembered, the least recently used are
+# dropped first
+SIGNATURE_CACHE_SIZE = int(os.getenv('SIGNATURE_CACHE_SIZE', '10000'))
+
+# Signatures by path, with the size and mtime of the file they were read from
+failure_signatures: 'OrderedDict[str,Tuple[Tuple[int,int],Optional[Tuple[str,str]]]]' = OrderedDict()
+
+failure_signatures_lock = threading.Lock()
+
+
+def normalize_signature(line:str) -> str:
+	for pattern, replacement in SIGNATURE_NORMALIZATIONS:
+		line = pattern.sub(replacement, line)
+	return line.strip()[:SEARCH_LINE_LENGTH]
+
+
+def failure_signature(path:str) -> Optional[Tuple[str,str]]:
+	"""Signature and the line it was made from, of the last line in the tail
+	of the log that looks like an error, or else its last line. None if the
+	log is missing or empty."""
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return None
+
+	key = (stat.st_size, stat.st_mtime_ns)
+	with failure_signatures_lock:
+		cached = failure_signatures.get(path)
+		if cached is not None and cached[0] == key:
+			failure_signatures.move_to_end(path)
+			return cached[1]
+
+	try:
+		with open(path, 'rb') as fh:
+			start = max(0, stat.st_size - SIGNATURE_TAIL_BYTES)
+			fh.seek(start)
+			lines = fh.read(SIGNATURE_TAIL_BYTES).decode('utf-8', 'replace').splitlines()
+	except OSError:
+		return None
+
+	if start > 0:
+		lines = lines[1:] # first line is probably incomplete
+
+	lines = [line.strip() for line in lines if line.strip()]
+	errors = [line for line in lines if SIGNATURE_ERROR.search(line)]
+	line = (errors or lines or [None])[-1]
+	signature = (normalize_signature(line), line[:SEARCH_LINE_LENGTH]) if line is not None else None
+	with failure_signatures_lock:
+		failure_signatures[path] = (key, signature)
+		failure_signatures.move_to_end(path)
+		while len(failure_signatures) > SIGNATURE_CACHE_SIZE:
+			failure_signatures.popitem(last=False)
+	return signature
+
+
+@app.route('/failures/')
+def list_failures(request):
+	"""Failed jobs, selected with the same filters as /jobs/, grouped by the
+	signature of the error at the end of their StdErr."""
+	filters = {
+		name: request.args[name].split(',')
+		for name in JobList.INDEXES
+		if request.args.get(name)
+	}
+	filters.setdefault('state', FAILURE_STATES)
+
+	jobs = []
+	for source in selected_sources(request):
+		with source.state.lock:
+			selection = [source.state.jobs.get(job_id) for job_id in source.state.jobs.find(**filters)]
+		jobs.extend(
+			(job_ref(source, job), job, os.path.join(source.slurm.path, job['StdErr']) if job.get('StdErr') else None)
+			for job in selection
+		)
+
+	with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+		signatures = executor.map(lambda path: failure_signature(path) if path else None, [path for _, _, path in jobs])
+
+	groups: Dict[Optional[str],Dict[str,Any]] = {}
+	for (job_id, job, path), signature in zip(jobs, signatures):
+		key, line = signature if signature is not None else (None, None)
+		if key not in groups:
+			groups[key] = {'signature': key, 'example': line, 'states': {}, 'jobs': []}
+		groups[key]['jobs'].append(job_id)
+		groups[key]['states'][job_state(job)] = groups[key]['states'].get(job_state(job), 0) + 1
+
+	return send_json({
+		'failures': sorted(groups.values(), key=lambda group: len(group['jobs']), reverse=True)
+	})
+
+
 def disk_quota():
 	lines = subprocess.check_output("quota").decode().splitlines()
 
@@ -587,6 +1477,10 @@ def disk_quota():
 			}
 
 
+def all_accounts() -> List[str]:
+	return sorted(set(chain.from_iterable(source.slurm.accounts for source in sources.values())))
+
+
 def slurm_account_balance(account):
 	return int(subprocess.check_output(['sbank', 'balance', 'statement', '-u', '-a', account]))
 
@@ -596,13 +1490,13 @@ def slurm_balance():
 		{
 			'account': account_name,
 			'balance': slurm_account_balance(account_name)
-		} for account_name in slurm.accounts
+		} for account_name in all_accounts()
 	]
 
 
 def lumi_balance():
 	out = []
-	for account in slurm.accounts:
+	for account in all_accounts():
 		with open(f'/var/lib/project_info/users/{account}/{account}.json') as fh:
 			billing = json.load(fh).get('billing', {})
 			out += [
@@ -628,7 +1522,7 @@ def lumi_disk_quota():
 		'flash':    3000000000,
 	}
 	partition = 'scratch'
-	for account in slurm.accounts:
+	for account in all_accounts():
 		gid = none_throws(subprocess.check_output(['getent', 'group', account])).split(b':')[2] # 3rd field
 		quota = subprocess.check_output(['lfs', 'quota', '-q', '-p', str(int(gid) + offsets[partition]), f'/{partition}/{account}']).split(b'\n')[1] # second line
 		fields = {
@@ -638,6 +1532,34 @@ def lumi_disk_quota():
 		yield {'proj': account, **fields}
 
 
+@app.route('/disk-usage/')
+def list_disk_usage(request):
+	"""Bytes and files in the shards of each collection and language. Takes
+	comma separated collection and language filters."""
+	collections = request.args['collection'].split(',') if request.args.get('collection') else None
+	languages = request.args['language'].split(',') if request.args.get('language') else None
+	usage = []
+	for source in selected_sources(request):
+		roots = {
+			(name, language): os.path.join(collection.path + '-shards', language)
+			for name, collection in source.collections().items()
+			if collections is None or name in collections
+			for language in collection.languages
+			if languages is None or language in languages
+		}
+		usage.extend(
+			{
+				'source': source.name,
+				'collection': collection,
+				'language': language,
+				'bytes': size,
+				'files': files
+			}
+			for (collection, language), (size, files) in sorted(source.disk_usage.scan(roots).items())
+		)
+	return send_json(usage)
+
+
 @app.route('/quota/')
 def list_quota(request):
 	try:
@@ -655,4 +1577,6 @@ def list_balance(request):
 
 
 if __name__ == "__main__":
+	for source in sources.values():
+		source.start(POLL_INTERVAL)
 	main(app)
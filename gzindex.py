@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""Random access into gzip files.
+
+The only way to get to some offset in a gzip file is to decompress everything
+before it. So while decompressing we leave checkpoints behind, zran-style: the
+offset in the compressed file and the state of the decompressor at that point
+(zlib's equivalent of zran's window and bit offset). Seeking then resumes from
+the nearest checkpoint before the target, and decompresses at most one span.
+
+The start of a gzip member (multi-member files) is a checkpoint that needs no
+decompressor state, and those are the only checkpoints that can be saved.
+
+BGZF files (block-gzipped, as written by bgzip and friends) say in each
+member's header how long it is, and in its trailer how much it decompresses
+to. For those we read the position of every member up front, so any offset
+is reached by decompressing a single block of at most 64K. Their blocks can
+also be decompressed independently, so scan_lines() spreads them over a
+process pool.
+"""
+import io
+import os
+import zlib
+import sys
+import struct
+import builtins
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor
+from threading import Lock
+from collections import OrderedDict
+from bisect import bisect_right
+from typing import Any, BinaryIO, Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+# Uncompressed bytes between checkpoints
+SPAN = 8 * 1024 * 1024
+
+# Memory used by a checkpoint's copy of the decompressor, about 7K of state
+# and the 32K window.
+CHECKPOINT_SIZE = 40 * 1024
+
+# Compressed bytes read from disk at a time
+CHUNK = 64 * 1024
+
+GZIP_WBITS = zlib.MAX_WBITS | 16
+
+# Compressed bytes per task when decompressing BGZF blocks in parallel
+PARALLEL_CHUNK = 32 * 1024 * 1024
+
+# Gzip member header up to and including XLEN
+GZIP_HEADER = struct.Struct('<4sIBBH')
+
+FEXTRA = 4
+
+
+class Checkpoint(NamedTuple):
+	offset: int # in the uncompressed data
+	raw_offset: int # in the compressed file
+	state: Any # copy of the zlib decompressor, or None at the start of a member
+
+
+class GzipIndex:
+	"""Checkpoints of a single gzip file. Shared between readers of that file,
+	which add checkpoints to it as they decompress new parts of the file."""
+	checkpoints: List[Checkpoint]
+
+	blocks: Optional[Tuple[array,array]] # uncompressed and compressed offsets of BGZF blocks
+
+	def __init__(self, span:int = SPAN, members:List[Tuple[int,int]] = [], blocks:Optional[Tuple[array,array]] = None):
+		self.span = span
+		self.checkpoints = [Checkpoint(0, 0, None)]
+		self.offsets = [0]
+		self.blocks = blocks
+		self.lock = Lock()
+		for offset, raw_offset in members:
+			self.add(offset, raw_offset, None)
+
+	def nearest(self, offset:int) -> Checkpoint:
+		"""Last checkpoint at or before offset"""
+		if self.blocks is not None:
+			offsets, raw_offsets = self.blocks
+			block = bisect_right(offsets, offset) - 1
+			return Checkpoint(offsets[block], raw_offsets[block], None)
+		with self.lock:
+			return self.checkpoints[bisect_right(self.offsets, offset) - 1]
+
+	def add(self, offset:int, raw_offset:int, decompressor:Any) -> None:
+		if self.blocks is not None:
+			return # Already know every block
+		with self.lock:
+			pos = bisect_right(self.offsets, offset)
+
+			# Not worth it if there is already a checkpoint within span
+			if offset - self.offsets[pos - 1] < self.span:
+				return
+			if pos < len(self.offsets) and self.offsets[pos] - offset < self.span:
+				return
+
+			state = decompressor.copy() if decompressor is not None else None
+			self.checkpoints.insert(pos, Checkpoint(offset, raw_offset, state))
+			self.offsets.insert(pos, offset)
+
+	def __sizeof__(self) -> int:
+		with self.lock:
+			return object.__sizeof__(self) \
+				+ sum(100 + (CHECKPOINT_SIZE if cp.state is not None else 0) for cp in self.checkpoints) \
+				+ sum(sys.getsizeof(table) for table in self.blocks or [])
+
+	def members(self) -> List[Tuple[int,int]]:
+		"""The checkpoints that can be stored and passed to GzipIndex() later."""
+		with self.lock:
+			return [(cp.offset, cp.raw_offset) for cp in self.checkpoints[1:] if cp.state is None]
+
+
+class GzipReader(io.RawIOBase):
+	"""Seekable raw reader of a gzip file. Use open() to get a buffered one."""
+	def __init__(self, fh:BinaryIO, index:GzipIndex, progress:Optional[Callable[[int],None]] = None):
+		self.fh = fh
+		self.index = index
+		self.progress = progress # called with the number of compressed bytes read so far
+		self.pos = 0
+		self._restore(index.checkpoints[0])
+
+	def _restore(self, checkpoint:Checkpoint) -> None:
+		if checkpoint.state is not None:
+			self.decompressor = checkpoint.state.copy()
+		else:
+			self.decompressor = zlib.decompressobj(GZIP_WBITS)
+		self.consumed = checkpoint.raw_offset # compressed bytes fed to the decompressor
+		self.pending = b'' # compressed bytes read but not yet decompressed
+		self.buffer = b'' # last bit of decompressed data
+		self.start = checkpoint.offset # offset of self.buffer in uncompressed data
+		self.end = checkpoint.offset # offset of the end of self.buffer
+
+	def _inflate(self) -> bytes:
+		"""Decompress the next bit of the file. Returns b'' at the end."""
+		while True:
+			if not self.pending:
+				self.fh.seek(self.consumed)
+				self.pending = self.fh.read(CHUNK)
+				if self.progress:
+					self.progress(self.consumed + len(self.pending))
+				if not self.pending:
+					if not self.decompressor.eof:
+						raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+					return b''
+
+			if self.decompressor.eof:
+				# Skip the zero padding that may follow a member
+				padding = len(self.pending) - len(self.pending.lstrip(b'\x00'))
+				self.consumed += padding
+				self.pending = self.pending[padding:]
+				if not self.pending:
+					continue
+				self.index.add(self.end, self.consumed, None)
+				self.decompressor = zlib.decompressobj(GZIP_WBITS)
+
+			data = self.decompressor.decompress(self.pending, CHUNK * 16)
+
+			remaining = self.decompressor.unused_data if self.decompressor.eof else self.decompressor.unconsumed_tail
+			self.consumed += len(self.pending) - len(remaining)
+			self.pending = remaining
+			self.end += len(data)
+
+			if not self.decompressor.eof:
+				self.index.add(self.end, self.consumed, self.decompressor)
+
+			if data:
+				return data
+
+	def readable(self) -> bool:
+		return True
+
+	def seekable(self) -> bool:
+		return True
+
+	def tell(self) -> int:
+		return self.pos
+
+	def seek(self, pos:int, whence:int = io.SEEK_SET) -> int:
+		if whence == io.SEEK_CUR:
+			pos += self.pos
+		elif whence != io.SEEK_SET:
+			raise io.UnsupportedOperation('can only seek relative to start or current position')
+		if pos < 0:
+			raise ValueError('negative seek position {}'.format(pos))
+		self.pos = pos
+		return self.pos
+
+	def readinto(self, b) -> int:
+		# Jump to a checkpoint if we can't get there by decompressing onwards,
+		# or if that would be cheaper.
+		if self.pos < self.start or self.index.nearest(self.pos).offset > self.end:
+			self._restore(self.index.nearest(self.pos))
+
+		while self.pos >= self.end:
+			data = self._inflate()
+			if not data:
+				return 0
+			self.start, self.buffer = self.end - len(data), data
+
+		n = min(len(b), self.end - self.pos)
+		offset = self.pos - self.start
+		b[:n] = self.buffer[offset:offset + n]
+		self.pos += n
+		return n
+
+	def close(self) -> None:
+		self.fh.close()
+		super().close()
+
+
+def read_bgzf_blocks(filename:str) -> Optional[Tuple[array,array]]:
+	"""Uncompressed and compressed offsets of every block, read from the
+	headers and trailers of the gzip members. None if it is not a BGZF file."""
+	offsets, raw_offsets = array('Q'), array('Q')
+	offset, raw_offset = 0, 0
+	with builtins.open(filename, 'rb', buffering=1024 * 1024) as fh:
+		while True:
+			fh.seek(raw_offset)
+			header = fh.read(GZIP_HEADER.size)
+			if not header:
+				break
+			if len(header) < GZIP_HEADER.size:
+				return None
+			magic, _, _, _, xlen = GZIP_HEADER.unpack(header)
+			if magic[:3] != b'\x1f\x8b\x08' or not magic[3] & FEXTRA:
+				return None
+
+			# Look for the BC subfield, which holds the block size - 1
+			extra = fh.read(xlen)
+			block_size = None
+			pos = 0
+			while pos + 4 <= len(extra):
+				si, slen = extra[pos:pos+2], int.from_bytes(extra[pos+2:pos+4], 'little')
+				if si == b'BC' and slen == 2:
+					block_size = int.from_bytes(extra[pos+4:pos+6], 'little') + 1
+				pos += 4 + slen
+			if block_size is None:
+				return None
+
+			# Trailer ends with the uncompressed size of the block
+			fh.seek(raw_offset + block_size - 4)
+			isize = int.from_bytes(fh.read(4), 'little')
+
+			if isize:
+				offsets.append(offset)
+				raw_offsets.append(raw_offset)
+			offset += isize
+			raw_offset += block_size
+
+	if not offsets:
+		offsets.append(0)
+		raw_offsets.append(0)
+
+	return offsets, raw_offsets
+
+
+def make_index(filename:str, span:int = SPAN) -> GzipIndex:
+	"""Empty index for filename, or one that knows every block if it is BGZF."""
+	return GzipIndex(span=span, blocks=read_bgzf_blocks(filename))
+
+
+# Memory the indexes kept by get_index() may use together
+CACHE_SIZE = int(os.getenv('GZINDEX_CACHE_MB', '256')) * 1000 * 1000
+
+_indexes: 'OrderedDict[str,Tuple[Tuple[int,int],GzipIndex]]' = OrderedDict()
+
+_indexes_lock = Lock()
+
+
+def _evict_indexes() -> None:
+	"""Forget the least recently used indexes until they fit in CACHE_SIZE.
+	Checkpoints are added while the indexes are used, so their size is only
+	known now. Readers that still use an evicted index keep it."""
+	size = sum(sys.getsizeof(index) for _, index in _indexes.values())
+	while size > CACHE_SIZE and len(_indexes) > 1:
+		_, (_, index) = _indexes.popitem(last=False)
+		size -= sys.getsizeof(index)
+
+
+def get_index(filename:str, span:int = SPAN) -> GzipIndex:
+	"""Index shared by every reader of filename in this process. Starts anew
+	when the file changes."""
+	stat = os.stat(filename)
+	key = os.path.realpath(filename)
+	with _indexes_lock:
+		if key in _indexes and _indexes[key][0] == (stat.st_size, stat.st_mtime_ns):
+			_indexes.move_to_end(key)
+			_evict_indexes()
+			return _indexes[key][1]
+
+	# Not holding the lock as make_index reads the file
+	index = make_index(filename, span)
+	with _indexes_lock:
+		_indexes[key] = (stat.st_size, stat.st_mtime_ns), index
+		_indexes.move_to_end(key)
+		_evict_indexes()
+	return index
+
+
+def open(filename:str, index:Optional[GzipIndex] = None, buffer_size:int = io.DEFAULT_BUFFER_SIZE, progress:Optional[Callable[[int],None]] = None) -> io.BufferedReader:
+	"""Like gzip.open(filename, 'rb'), but cheap to seek in."""
+	return io.BufferedReader(GzipReader(builtins.open(filename, 'rb'), index or get_index(filename), progress), buffer_size)
+
+
+def _scan_range(filename:str, raw_offset:int, length:int, first:bool, parse:Optional[Callable[[bytes],Any]]) -> List[Tuple[int,Any]]:
+	"""Lines starting in the length bytes of uncompressed data from the block
+	at raw_offset. A line belongs to the range that has the newline before it,
+	so we skip the first line unless it is the first range, and we finish the
+	last line even if it continues in the next range."""
+	reader = GzipReader(builtins.open(filename, 'rb'), GzipIndex())
+	reader._restore(Checkpoint(0, raw_offset, None))
+	lines = []
+	with io.BufferedReader(reader) as fh:
+		pos = 0 if first else len(fh.readline())
+		while pos <= length:
+			line = fh.readline()
+			if not line:
+				break
+			lines.append((pos, parse(line) if parse else None))
+			pos += len(line)
+	return lines
+
+
+def scan_lines(filename:str, parse:Optional[Callable[[bytes],Any]] = None, index:Optional[GzipIndex] = None, progress:Optional[Callable[[int],None]] = None, workers:int = 1, pool:Optional[Executor] = None) -> Iterator[Tuple[int,Any]]:
+	"""Yields the offset of each line with what parse(line) makes of it. BGZF
+	files are decompressed on pool, or on a pool of workers processes made for
+	the occasion, so parse has to be something that can be pickled."""
+	if index is None:
+		index = get_index(filename)
+
+	if index.blocks is None or (pool is None and workers <= 1) or len(index.blocks[0]) < 2:
+		with open(filename, index, progress=progress) as fh:
+			pos = 0
+			for line in fh:
+				yield pos, parse(line) if parse else None
+				pos += len(line)
+		return
+
+	# Split the blocks into ranges of about PARALLEL_CHUNK compressed bytes
+	offsets, raw_offsets = index.blocks
+	ranges = []
+	block = 0
+	while block < len(offsets):
+		end = bisect_right(raw_offsets, raw_offsets[block] + PARALLEL_CHUNK, lo=block + 1)
+		length = (offsets[end] if end < len(offsets) else sys.maxsize) - offsets[block]
+		ranges.append((block, end, length))
+		block = end
+
+	own_pool = pool is None
+	executor = ProcessPoolExecutor(max_workers=min(workers, len(ranges))) if own_pool else pool
+	futures = [
+		executor.submit(_scan_range, filename, raw_offsets[start], length, start == 0, parse)
+		for start, _, length in ranges
+	]
+	try:
+		for (start, end, _), future in zip(ranges, futures):
+			for pos, parsed in future.result():
+				yield offsets[start] + pos, parsed
+			if progress:
+				progress(raw_offsets[end] if end < len(offsets) else os.path.getsize(filename))
+	finally:
+		# Don't leave work for a shared pool if we stopped early
+		for future in futures:
+			future.cancel()
+		if own_pool:
+			executor.shutdown()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Builds the sidecar indexes of warc2text.py and bleualign.py ahead of time,
+so the viewers don't have to build them while you wait.
+
+Give it a warc2text output directory (with <model>/<lang>/text.gz and url.gz
+below it) or a bleualign work directory (with *-bleualign-input.tab.gz files
+and their ../aligned/*-aligned.gz counterparts). Indexes that are newer than
+the files they index are skipped, so it can be rerun after it was interrupted
+or after a pipeline step added more files.
+"""
+import os
+import sys
+import time
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, List, NamedTuple
+
+import warc2text
+import bleualign
+
+
+class Task(NamedTuple):
+	name: str
+	sources: List[str] # files that are indexed
+	sidecars: List[List[str]] # per file the index is written to, the places it can be
+	fn: Callable[..., None]
+	args: tuple
+
+
+def is_newer(path:str, mtime:float) -> bool:
+	try:
+		return os.path.getmtime(path) >= mtime
+	except OSError:
+		return False
+
+
+def is_up_to_date(task:Task) -> bool:
+	"""Whether each of the sidecars is newer than the sources in one of the
+	places the viewers look for it."""
+	try:
+		newest_source = max(os.path.getmtime(path) for path in task.sources)
+	except OSError:
+		return False
+	return all(any(is_newer(path, newest_source) for path in places) for places in task.sidecars)
+
+
+# The indexer runs --workers tasks at the same time already, so the tasks
+# themselves scan files in their own process instead of in a pool of their
+# own. (warc2text and bleualign only use a pool when they're given one.)
+
+def index_language(root:str, model:str, lang:str) -> None:
+	warc2text.ROOT = root
+	warc2text.RecordIndex(model, lang)
+	warc2text.domain_cache.count_all([os.path.join(root, model, lang, 'url.gz')])
+
+
+def index_input(filename:str) -> None:
+	bleualign.index_document_2(filename)
+
+
+def index_aligned(aligned_filename:str) -> None:
+	bleualign.UrlPairIndex(aligned_filename)
+
+
+def warc2text_tasks(path:str) -> List[Task]:
+	tasks = []
+	for dirpath, dirnames, filenames in os.walk(path):
+		dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+		if 'text.gz' not in filenames or 'url.gz' not in filenames:
+			continue
+		model_path, lang = os.path.split(os.path.abspath(dirpath))
+		root, model = os.path.split(model_path)
+		tasks.append(Task(
+			name=os.path.join(model, lang),
+			sources=[os.path.join(dirpath, 'text.gz'), os.path.join(dirpath, 'url.gz')],
+			sidecars=[[os.path.join(dirpath, warc2text.RecordIndex.FILENAME)], [os.path.join(dirpath, warc2text.DomainCache.FILENAME)]],
+			fn=index_language,
+			args=(root, model, lang)))
+	return tasks
+
+
+def bleualign_tasks(path:str) -> List[Task]:
+	tasks = []
+	for filename in sorted(glob(os.path.join(path, '**', '*-bleualign-input.tab.gz'), recursive=True)):
+		tasks.append(Task(
+			name=os.path.relpath(filename, path),
+			sources=[filename],
+			sidecars=[bleualign.sidecar_paths(filename, bleualign.DocumentIndex.SUFFIX)],
+			fn=index_input,
+			args=(filename,)))
+		aligned_filename = bleualign.get_aligned_filename(filename)
+		if not aligned_filename:
+			continue
+		tasks.append(Task(
+			name=os.path.relpath(aligned_filename, path),
+			sources=[aligned_filename],
+			sidecars=[bleualign.sidecar_paths(aligned_filename, bleualign.UrlPairIndex.SUFFIX)],
+			fn=index_aligned,
+			args=(aligned_filename,)))
+	return tasks
+
+
+def run(tasks:List[Task], workers:int, force:bool = False) -> None:
+	todo = [task for task in tasks if force or not is_up_to_date(task)]
+	print('{} indexes, {} up to date, {} to build'.format(len(tasks), len(tasks) - len(todo), len(todo)), file=sys.stderr)
+
+	start = time.time()
+	processed = 0
+	failed = 0
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		futures = {pool.submit(timed, task.fn, *task.args): task for task in todo}
+		for n, future in enumerate(as_completed(futures), start=1):
+			task = futures[future]
+			size = sum(os.path.getsize(path) for path in task.sources)
+			try:
+				duration = future.result()
+			except Exception as e:
+				failed += 1
+				print('[{}/{}] {}: failed: {!r}'.format(n, len(todo), task.name, e), file=sys.stderr)
+				continue
+			processed += size
+			print('[{}/{}] {}: {} in {:.1f}s ({}/s)'.format(n, len(todo), task.name,
+				bleualign.human_filesize(size), duration, bleualign.human_filesize(size / max(duration, 1e-6))), file=sys.stderr)
+
+	duration = time.time() - start
+	print('Indexed {} in {:.1f}s ({}/s){}'.format(
+		bleualign.human_filesize(processed), duration, bleualign.human_filesize(processed / max(duration, 1e-6)),
+		', {} failed'.format(failed) if failed else ''), file=sys.stderr)
+
+	if failed:
+		sys.exit(1)
+
+
+def timed(fn:Callable[..., None], *args) -> float:
+	start = time.time()
+	fn(*args)
+	return time.time() - start
+
+
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--workers', '-j', type=int, default=os.cpu_count() or 1, help='Number of files to index at the same time [default: number of cpus]')
+	parser.add_argument('--force', '-f', action='store_true', help='Rebuild indexes even if they are up to date')
+	parser.add_argument('path', help='warc2text output directory or bleualign work directory')
+	args = parser.parse_args()
+
+	tasks = bleualign_tasks(args.path) or warc2text_tasks(args.path)
+	if not tasks:
+		parser.error('found neither warc2text output nor bleualign input in {}'.format(args.path))
+
+	run(tasks, args.workers, args.force)
+
+
+if __name__ == '__main__':
+	main()
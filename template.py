@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import re
 import builtins
+from typing import Iterator
 from pprint import pprint
 
 VARIABLE_EXPRESSION = r'[a-zA-Z\_][a-zA-Z0-9\_\-]*'
@@ -34,7 +35,11 @@ class Node:
 		self.children.append(child)
 
 	def format(self, **kwargs):
-		return "".join([child.format(**kwargs) for child in self.children])
+		return "".join(self.render_iter(**kwargs))
+
+	def render_iter(self, **kwargs):
+		for child in self.children:
+			yield from child.render_iter(**kwargs)
 
 
 class Raw:
@@ -50,6 +55,9 @@ class Raw:
 	def format(self, **kwargs):
 		return str(self.data)
 
+	def render_iter(self, **kwargs):
+		yield str(self.data)
+
 
 class Expression:
 	def __init__(self, expr):
@@ -65,6 +73,9 @@ class Expression:
 	def format(self, **kwargs):
 		return str(eval(self.expr, globals(), kwargs))
 
+	def render_iter(self, **kwargs):
+		yield str(eval(self.expr, globals(), kwargs))
+
 
 class IfNode(Node):
 	def __init__(self):
@@ -92,11 +103,11 @@ class IfNode(Node):
 	def append(self, child):
 		self.cases[-1][-1].append(child)
 
-	def format(self, **kwargs):
+	def render_iter(self, **kwargs):
 		for condition, _, node in self.cases:
 			if eval(condition, globals(), kwargs):
-				return node.format(**kwargs)
-		return ""
+				yield from node.render_iter(**kwargs)
+				return
 
 
 class ForNode(Node):
@@ -122,11 +133,9 @@ class ForNode(Node):
 			expr=self.expr[1],
 			node=super().__str__())
 
-	def format(self, **kwargs):
-		return "".join(
-			super(ForNode, self).format(**{**kwargs, **local})
-			for local in eval(self.loop, globals(), kwargs)
-		)
+	def render_iter(self, **kwargs):
+		for local in eval(self.loop, globals(), kwargs):
+			yield from super(ForNode, self).render_iter(**{**kwargs, **local})
 
 
 def compile(root, text):
@@ -193,6 +202,10 @@ class Template(Node):
 	def format(self, **kwargs) -> str:
 		return super().format(**(self.args | kwargs))
 
+	def render_iter(self, **kwargs) -> Iterator[str]:
+		"""Like format(), but yields the output piece by piece while rendering."""
+		return super().render_iter(**(self.args | kwargs))
+
 
 if __name__ == '__main__':
 	TEMPLATE=r'''
@@ -221,4 +234,5 @@ if __name__ == '__main__':
 	print(repr(tpl))
 	print(str(tpl))
 	print(tpl.format(lut=data, beep='boop'))
+	assert ''.join(tpl.render_iter(lut=data, beep='boop')) == tpl.format(lut=data, beep='boop')
 
@@ -1,20 +1,32 @@
 #!/usr/bin/env python3
 import html
 import os
+import re
+import sys
+import json
 import gzip
-from typing import Counter, Generic, NamedTuple, Iterable, Iterator, List, TypeVar
+import mmap
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor
+from threading import Lock
+from typing import Any, Counter, Dict, Generic, NamedTuple, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
 from urllib.parse import urlparse
-from itertools import count, islice
+from itertools import count
 from base64 import b64decode
 
 
-from web import Application, Request, Response, main
+import gzindex
+from bleualign import lazycache
+from web import Application, Request, Response, StreamResponse, main
 from template import Template
 
 ROOT = os.getcwd()
 
 PAGE = 10
 
+# Number of pages to link to before and after the current one
+PAGE_LINKS = 10
+
 app = Application()
 
 template_header = r"""
@@ -71,9 +83,9 @@ template_language_index = Template(template_header + r"""
 {% endfor %}
 
 <ol>
-{% for slice in records.pages %}
-<li>
-	<a href="{{ app.url_for('language_index', model=model, lang=lang, page=slice.page) }}" class="{% 'current' if slice.page == page else '' %}">
+{% for slice in records.nearby(page) %}
+<li value="{{ slice.page + 1 }}">
+	<a href="{{ app.url_for('language_index', model=model, lang=lang, page=slice.page) }}" class="{{ 'current' if slice.page == page else '' }}">
 		{{ slice.start + 1 }}&nbsp;&ndash;&nbsp;{{slice.end}}
 	</a>
 </li>
@@ -91,31 +103,51 @@ template_record = Template(template_header + r"""
 """, html=html, app=app)
 
 def render_template(template, **kwargs) -> Response:
-	return Response(template.format(**kwargs), 200, headers={'Content-Type': 'text/html'})
+	return StreamResponse(template.render_iter(**kwargs), 200, headers={'Content-Type': 'text/html; charset=utf-8'})
 
 
 T = TypeVar('T')
 
 class Page(Generic[T]):
-	def __init__(self, items: List[T], page:int):
+	"""Page of a sequence. Only slices its items out of the sequence when
+	iterated over, so for a RecordIndex only this page's records are decoded."""
+	def __init__(self, items: Sequence[T], page:int):
 		self.page = page
 		self.start = page * PAGE
 		self.end = min((page + 1) * PAGE, len(items))
-		self.items = items[self.start:self.end]
+		self.items = items
 
 	def __iter__(self) -> Iterator[T]:
-		return iter(self.items)
+		return iter(self.items[self.start:self.end])
+
+
+class Pages(Sequence[Page[T]]):
+	def __init__(self, items: Sequence[T]):
+		self.items = items
+
+	def __len__(self) -> int:
+		# An empty sequence still has one (empty) page
+		return max(1, (len(self.items) + PAGE - 1) // PAGE)
+
+	def __getitem__(self, page:int) -> Page[T]:
+		if page < 0:
+			page += len(self)
+		if page < 0 or page >= len(self):
+			raise IndexError('page out of range')
+		return Page(self.items, page)
 
 
 class Pagination(Generic[T]):
-	items: List[T]
-	pages: List[Page[T]]
-	def __init__(self, items: Iterable[T]):
-		self.items = list(items)
-		self.pages = [
-			Page(self.items, index)
-			for index in range(int(len(self.items) / PAGE))
-		]
+	items: Sequence[T]
+	pages: Pages[T]
+	def __init__(self, items: Sequence[T]):
+		self.items = items
+		self.pages = Pages(items)
+
+	def nearby(self, page:int, distance:int = PAGE_LINKS) -> List[Page[T]]:
+		"""First and last page, and the pages around page."""
+		numbers = {0, len(self.pages) - 1, *range(page - distance, page + distance + 1)}
+		return [self.pages[n] for n in sorted(numbers) if 0 <= n < len(self.pages)]
 
 
 class Language:
@@ -135,7 +167,18 @@ class Record(NamedTuple):
 	url: str
 
 
+# Netloc of the common scheme://netloc/path?query#fragment url, which is all
+# urlparse() would do for these, but a lot quicker.
+NETLOC_EXPRESSION = rb'^[a-zA-Z][a-zA-Z0-9+\-.]*://([^/?#\s]*)(?=[/?#]|\s*$)'
+
+netloc_bytes = re.compile(NETLOC_EXPRESSION)
+
+netloc_str = re.compile(NETLOC_EXPRESSION.decode())
+
+
 def domain(url):
+    if match := netloc_str.match(url):
+        return match[1]
     try:
         return urlparse(url).netloc
     except:
@@ -147,14 +190,277 @@ def domains(urls):
 
 
 def count_domains(path:str) -> Counter:
-	with gzip.open(path) as fh:
-		return Counter(domain(line.decode().strip()) for line in fh)
+	counts = Counter()
+	# One pass from start to end, so no need for gzindex' checkpoints
+	with gzip.open(path, 'rb') as fh:
+		for line in fh:
+			if match := netloc_bytes.match(line):
+				counts[match[1]] += 1
+			else:
+				counts[domain(line.decode('utf-8', 'replace').strip()).encode()] += 1
+	return Counter({netloc.decode('utf-8', 'replace'): count for netloc, count in counts.items()})
+
+
+# Processes that url.gz files are counted on, and that BGZF files are scanned
+# with while building a RecordIndex. Made in __main__ before the
+# server starts, so that there is one pool for all requests and it isn't
+# forked from the server's threads. Without it files are read in the thread
+# that asks for them.
+scan_pool: Optional[ProcessPoolExecutor] = None
+
+
+class DomainCache:
+	"""Domain counts per url.gz, stored in a sidecar file next to it and
+	remembered in memory. Both are keyed on the file's path, size and mtime,
+	so a changed url.gz is counted again."""
+	FILENAME = '.domains.json'
+
+	def __init__(self):
+		self.counts: Dict[str,Tuple[List[Any],Counter]] = {}
+		self.pending: Dict[str,Future] = {} # paths that are being counted
+		self.lock = Lock()
+
+	def _key(self, path:str) -> List[Any]:
+		stat = os.stat(path)
+		return [os.path.realpath(path), stat.st_size, stat.st_mtime_ns]
+
+	def _sidecar(self, path:str) -> str:
+		return os.path.join(os.path.dirname(path), self.FILENAME)
+
+	def get(self, path:str) -> Optional[Counter]:
+		key = self._key(path)
+		with self.lock:
+			if path in self.counts and self.counts[path][0] == key:
+				return self.counts[path][1]
+
+		try:
+			with open(self._sidecar(path)) as fh:
+				data = json.load(fh)
+			if data['key'] != key:
+				return None
+		except (OSError, ValueError, KeyError):
+			return None
+
+		counts = Counter(data['domains'])
+		with self.lock:
+			self.counts[path] = key, counts
+		return counts
+
+	def put(self, path:str, counts:Counter) -> None:
+		key = self._key(path)
+		with self.lock:
+			self.counts[path] = key, counts
+
+		filename = self._sidecar(path)
+		try:
+			with open(filename + '.tmp', 'w') as fh:
+				json.dump({'key': key, 'domains': counts}, fh)
+			os.replace(filename + '.tmp', filename)
+		except OSError:
+			pass # Read-only corpus, memory will have to do.
+
+	def count_all(self, paths:List[str]) -> List[Counter]:
+		"""Domain counts for all paths, counting the ones not in the cache in
+		parallel on scan_pool. Paths that another request is already counting
+		are waited for instead of counted again."""
+		counts: Dict[str,Any] = {path: self.get(path) for path in paths}
+
+		missing, waiting = [], {}
+		with self.lock:
+			for path, count in counts.items():
+				if count is not None:
+					continue
+				if path in self.pending:
+					waiting[path] = self.pending[path]
+				else:
+					self.pending[path] = Future()
+					missing.append(path)
+
+		try:
+			if scan_pool is not None and len(missing) > 1:
+				results = list(scan_pool.map(count_domains, missing))
+			else:
+				results = [count_domains(path) for path in missing]
+		except BaseException as e:
+			with self.lock:
+				for path in missing:
+					self.pending.pop(path).set_exception(e)
+			raise
+
+		for path, count in zip(missing, results):
+			self.put(path, count)
+			counts[path] = count
+			with self.lock:
+				self.pending.pop(path).set_result(count)
+
+		for path, future in waiting.items():
+			counts[path] = future.result()
+
+		return [counts[path] for path in paths]
+
+
+domain_cache = DomainCache()
+
+
+def make_record(index:int, text:bytes, url:bytes) -> Record:
+	return Record(index, b64decode(text.rstrip()).decode('utf-8', 'ignore').split('\n'), url.rstrip().decode())
 
 
 def read_records(model:str, lang:str) -> Iterable[Record]:
-	with gzip.open(os.path.join(ROOT, model, lang, 'text.gz')) as fh_text, gzip.open(os.path.join(ROOT, model, lang, 'url.gz')) as fh_url:
+	with gzindex.open(os.path.join(ROOT, model, lang, 'text.gz')) as fh_text, gzindex.open(os.path.join(ROOT, model, lang, 'url.gz')) as fh_url:
 		for index, text, url in zip(count(), fh_text, fh_url):
-			yield Record(index, b64decode(text.rstrip()).decode('utf-8', 'ignore').split('\n'), url.rstrip().decode())
+			yield make_record(index, text, url)
+
+
+def index_lines(path:str, index:gzindex.GzipIndex) -> array:
+	return array('Q', (pos for pos, _ in gzindex.scan_lines(path, index=index, pool=scan_pool)))
+
+
+class RecordIndex:
+	"""Offset of every record in a language's text.gz and url.gz. Stored in a
+	sidecar file next to them, together with the gzip member offsets, so it is
+	only built once. Reading a record decompresses from the nearest gzip
+	checkpoint instead of from the start of the file."""
+	FILENAME = '.index'
+
+	VERSION = 1
+
+	FILES = ('text.gz', 'url.gz')
+
+	offsets: Dict[str,Any] # memoryview or array of uncompressed line offsets per file
+
+	def __init__(self, model:str, lang:str):
+		self.path = os.path.join(ROOT, model, lang)
+		self.gzip_indexes = {name: gzindex.get_index(os.path.join(self.path, name)) for name in self.FILES}
+		header = self._load()
+		if header is None:
+			header = self._build()
+		self.size = header['records']
+
+	def _stat(self) -> Dict[str,List[int]]:
+		stats = {name: os.stat(os.path.join(self.path, name)) for name in self.FILES}
+		return {name: [stat.st_size, stat.st_mtime_ns] for name, stat in stats.items()}
+
+	def _load(self) -> Optional[Dict[str,Any]]:
+		try:
+			with open(os.path.join(self.path, self.FILENAME), 'rb') as fh:
+				header = json.loads(fh.readline())
+				if header.get('version') != self.VERSION or header['files'] != self._stat():
+					return None
+				data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+		except (OSError, ValueError, KeyError):
+			return None
+
+		# A sidecar that was cut short is built again
+		if len(data) != header.get('data', 0) + 8 * len(self.FILES) * header.get('records', -1):
+			data.close()
+			return None
+
+		offsets = memoryview(data)[header['data']:].cast('Q')
+		self.offsets = {
+			name: offsets[n * header['records']:(n + 1) * header['records']]
+			for n, name in enumerate(self.FILES)
+		}
+
+		for name, members in header['members'].items():
+			for offset, raw_offset in members:
+				self.gzip_indexes[name].add(offset, raw_offset, None)
+
+		return header
+
+	def _build(self) -> Dict[str,Any]:
+		stat = self._stat()
+
+		self.offsets = {}
+		for name in self.FILES:
+			self.offsets[name] = index_lines(os.path.join(self.path, name), self.gzip_indexes[name])
+
+		# Same as zip() in read_records(): ignore trailing lines without partner
+		records = min(len(offsets) for offsets in self.offsets.values())
+		for name in self.FILES:
+			del self.offsets[name][records:]
+
+		header = {
+			'version': self.VERSION,
+			'records': records,
+			'files': stat,
+			'members': {name: index.members() for name, index in self.gzip_indexes.items()},
+		}
+
+		# Pad the header so the offsets that follow it are aligned
+		line = json.dumps(header).encode() + b'\n'
+		header['data'] = (len(line) + 32) // 8 * 8
+		line = json.dumps(header).encode()
+		line += b' ' * (header['data'] - len(line) - 1) + b'\n'
+
+		# Write to a temp file first so concurrent requests don't read half an index
+		filename = os.path.join(self.path, self.FILENAME)
+		try:
+			with open(filename + '.tmp', 'wb') as fh:
+				fh.write(line)
+				for name in self.FILES:
+					self.offsets[name].tofile(fh)
+			os.replace(filename + '.tmp', filename)
+		except OSError:
+			pass # Read-only corpus, we'll just have to do with the in-memory index.
+
+		return header
+
+	def __len__(self) -> int:
+		return self.size
+
+	def records(self, start:int, stop:int) -> Iterator[Record]:
+		"""Decode records start up to stop. Only decompresses those."""
+		stop = min(stop, self.size)
+		if start >= stop:
+			return
+
+		fh_text, fh_url = (
+			gzindex.open(os.path.join(self.path, name), self.gzip_indexes[name])
+			for name in self.FILES
+		)
+
+		with fh_text, fh_url:
+			fh_text.seek(self.offsets['text.gz'][start])
+			fh_url.seek(self.offsets['url.gz'][start])
+			for index in range(start, stop):
+				yield make_record(index, fh_text.readline(), fh_url.readline())
+
+	def __getitem__(self, index:Union[int,slice]) -> Union[Record,List[Record]]:
+		if isinstance(index, slice):
+			start, stop, step = index.indices(self.size)
+			if step != 1:
+				raise ValueError('slice step not supported')
+			return list(self.records(start, stop))
+		if index < 0 or index >= self.size:
+			raise IndexError('record index out of range')
+		return next(self.records(index, index + 1))
+
+	def __iter__(self) -> Iterator[Record]:
+		return self.records(0, self.size)
+
+	def __sizeof__(self) -> int:
+		# Offsets read from the sidecar are mmapped and cost next to nothing
+		return super().__sizeof__() \
+			+ sum(sys.getsizeof(offsets) for offsets in self.offsets.values()) \
+			+ sum(sys.getsizeof(index) for index in self.gzip_indexes.values())
+
+
+# Memory the record indexes kept around between requests may use, in megabytes
+RECORD_INDEX_CACHE_SIZE = int(os.getenv('RECORD_INDEX_CACHE_MB', '256')) * 1000 * 1000
+
+RecordIndexKey = Tuple[str,str,Tuple[Tuple[int,int],...]]
+
+# Keyed on the size and mtime of the files as well, so changed files are
+# indexed again. Also what keeps the index of a read-only corpus, which has no
+# sidecar, from being built again for every request. Simultaneous first
+# requests for a language wait for one build, without holding up the others.
+record_indexes: 'lazycache[RecordIndexKey,RecordIndex]' = lazycache(lambda key: RecordIndex(key[0], key[1]), RECORD_INDEX_CACHE_SIZE, sizeof=sys.getsizeof)
+
+
+def record_index(model:str, lang:str) -> RecordIndex:
+	stats = (os.stat(os.path.join(ROOT, model, lang, name)) for name in RecordIndex.FILES)
+	return record_indexes[model, lang, tuple((stat.st_size, stat.st_mtime_ns) for stat in stats)]
 
 
 @app.route('/')
@@ -169,12 +475,17 @@ def model_index(request:Request) -> Response:
 
 @app.route('/<str:model>/')
 def output_index(request:Request, model:str) -> Response:
-	langs = [
-		Language(item.name, count_domains(os.path.join(item.path, 'url.gz')))
+	names = [
+		item.name
 		for item in os.scandir(os.path.join(ROOT, model))
 		if item.is_dir() and not item.name.startswith('.')
 	]
 
+	langs = [
+		Language(name, domains)
+		for name, domains in zip(names, domain_cache.count_all([os.path.join(ROOT, model, name, 'url.gz') for name in names]))
+	]
+
 	total = sum(lang.size for lang in langs)
 
 	langs.sort(key=lambda lang: lang.size, reverse=True)
@@ -185,14 +496,20 @@ def output_index(request:Request, model:str) -> Response:
 @app.route('/<str:model>/<str:lang>/')
 @app.route('/<str:model>/<str:lang>/<int:page>/')
 def language_index(request:Request, model:str, lang:str, page:int=0) -> Response:
-	records = read_records(model, lang)
-	return render_template(template_language_index, model=model, lang=lang, page=page, records=Pagination(records))
+	records = Pagination(record_index(model, lang))
+	if page >= len(records.pages):
+		return Response('Page not found: {}'.format(page), 404)
+	return render_template(template_language_index, model=model, lang=lang, page=page, records=records)
 
 
 @app.route('/<str:model>/<str:lang>/records/<int:index>/')
 def record(request:Request, model:str, lang:str, index:int) -> Response:
-	record = next(iter(islice(read_records(model, lang), index, index + 1)))
+	record = record_index(model, lang)[index]
 	return render_template(template_record, model=model, lang=lang, record=record)
 
 if __name__ == '__main__':
+	workers = os.cpu_count() or 1
+	scan_pool = ProcessPoolExecutor(max_workers=workers)
+	# Start its processes now, while this is still the only thread
+	list(scan_pool.map(abs, range(workers)))
 	main(app)
\ No newline at end of file
@@ -6,12 +6,12 @@ import sys
 import mimetypes
 from abc import ABC, abstractmethod
 from functools import partial
-from typing import Protocol, Set, Callable, Type, Any, Dict, Optional, Tuple, Pattern
+from typing import Protocol, Set, Callable, Type, Any, Dict, Optional, Tuple, Pattern, Iterable
 from dataclasses import dataclass
 from pprint import pprint, pformat
 from collections import defaultdict
 from itertools import chain
-from urllib.parse import quote_plus, unquote_plus, urlencode, urlsplit
+from urllib.parse import quote_plus, unquote_plus, urlencode, urlsplit, parse_qsl
 import socket # For gethostbyaddr()
 import select
 from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler, HTTPStatus, test as _http_server_test
@@ -37,6 +37,7 @@ class Request:
 	def __init__(self, method: str, url: str):
 		self.method = method
 		self.scheme, self.netloc, self.path, self.query, _ = urlsplit(url)
+		self.args = dict(parse_qsl(self.query))
 
 @dataclass
 class Response:
@@ -55,6 +56,7 @@ class Response:
 		for key, value in self.headers.items():
 			handler.send_header(key, value)
 		handler.end_headers()
+		setattr(handler, 'response_started', True)
 
 	def write(self, handler: BaseHTTPRequestHandler) -> None:
 		body = str(self.body).encode('utf-8', 'replace')
@@ -63,6 +65,49 @@ class Response:
 		handler.wfile.write(body)
 
 
+class StreamResponse(Response):
+	"""Response that writes its body while it is being produced by an iterable
+	of strings. Uses chunked transfer encoding when the connection speaks
+	HTTP/1.1, otherwise the end of the body is marked by closing the connection."""
+	def __init__(self, body: Iterable[str], status_code:int = 200, headers: Optional[Dict[str,Any]] = None, buffer_size:int = 16384):
+		super().__init__('', status_code, headers)
+		self.chunks = body
+		self.buffer_size = buffer_size
+
+	def write(self, handler: BaseHTTPRequestHandler) -> None:
+		chunked = handler.protocol_version >= 'HTTP/1.1' and handler.request_version >= 'HTTP/1.1'
+		if chunked:
+			self.headers['Transfer-Encoding'] = 'chunked'
+		else:
+			handler.close_connection = True
+		self._write_headers(handler)
+
+		def send(data: bytes) -> None:
+			if chunked:
+				handler.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+			else:
+				handler.wfile.write(data)
+			handler.wfile.flush()
+
+		# Template output comes in tiny fragments, so collect them into
+		# reasonably sized writes instead of a syscall per fragment.
+		buffer = []
+		size = 0
+		for chunk in self.chunks:
+			data = str(chunk).encode('utf-8', 'replace')
+			buffer.append(data)
+			size += len(data)
+			if size >= self.buffer_size:
+				send(b''.join(buffer))
+				buffer, size = [], 0
+
+		if size:
+			send(b''.join(buffer))
+
+		if chunked:
+			handler.wfile.write(b'0\r\n\r\n')
+
+
 class FileLike(Protocol):
 	def read(self) -> bytes:
 		...
@@ -255,6 +300,8 @@ class Application:
 
 
 class RequestHandler(BaseHTTPRequestHandler):
+	response_started = False # whether the status line of the response is sent
+
 	def __init__(self, *args, app:Application, **kwargs):
 		self.app = app
 		super().__init__(*args, **kwargs)
@@ -289,11 +336,19 @@ class RequestHandler(BaseHTTPRequestHandler):
 				self.send_error(HTTPStatus.NOT_IMPLEMENTED, "Unsupported method (%r)" % self.command)
 				return
 
+			self.response_started = False
 			try:
 				response = route.callback(request, **parameters)
 				self.app.write_response(response, self)
 				self.wfile.flush() #actually send the response if not already done.
 			except Exception as e:
+				if self.response_started:
+					# Too late for an error page, the status line and part of the
+					# body are out already. Closing the connection without ending
+					# the body tells the client the response is incomplete.
+					self.log_error("Error while writing response: %r\n%s", e, _full_stack())
+					self.close_connection = True
+					return
 				self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, "Error while handling request: {!r}\n\n{}".format(e, _full_stack()))
 				return
 		except socket.timeout as e: